@@ -0,0 +1,266 @@
+""" Headless self-play arena for Teeko2Player configurations.
+
+Two configurations, A and B, given as JSON dicts of Teeko2Player keyword
+arguments, play each other on a process pool, alternating colors from game to
+game. Every move goes through the players' own opponent_move() and
+place_piece(), and the arena also checks the drop/move phase rules; an illegal
+move loses the game. Games longer than --max-plies, or where a position occurs
+--repetitions times, are draws.
+
+Each finished game is appended to a JSONL file as soon as it ends, so a run can
+be stopped and resumed with the same command:
+
+    python arena.py --games 2000 --a '{"time_limit": 0.1}' \\
+        --b '{"time_limit": 0.1, "max_depth": 2}' --out arena.jsonl
+
+The first line of the file records the configurations; the summary (win/loss/
+draw rates, game lengths, move latency percentiles) covers all games in the file.
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from bitboard import Board
+from game import Teeko2Player
+from repetition import DEFAULT_REPETITIONS, DrawRule, PositionHistory
+
+DEFAULT_MAX_PLIES = 200
+
+
+def play_game(index, config_a, config_b, max_plies=DEFAULT_MAX_PLIES, seed=0,
+              repetitions=DEFAULT_REPETITIONS):
+    """ Plays one game between two configurations.
+
+    A plays black in even games and red in odd games.
+
+    Args:
+        index (int): number of the game
+        config_a (dict): Teeko2Player keyword arguments of A
+        config_b (dict): Teeko2Player keyword arguments of B
+        max_plies (int): number of plies after which the game is a draw
+        seed (int): base seed of the players' random choices
+        repetitions (int): number of occurrences of a position that make the game
+            a draw, 0 to play on
+
+    Returns:
+        dict: the game record: game index, which of A and B played black, the
+            winner ('A', 'B' or None for a draw), the reason the game ended,
+            its length in plies and the latency of every move of A and B
+    """
+    random.seed(seed + index)
+    names = ('A', 'B') if index % 2 == 0 else ('B', 'A')
+    configs = {'A': config_a, 'B': config_b}
+    players = []
+    for name, piece in zip(names, Teeko2Player.pieces):
+        players.append(Teeko2Player(piece=piece, **configs[name]))
+
+    latency = {'A': [], 'B': []}
+    winner = None
+    reason = None
+    plies = 0
+    rule = DrawRule(repetitions, max_plies)
+    history = PositionHistory([Board().key(0)])
+    try:
+        while reason is None:
+            turn = plies % 2
+            mover = players[turn]
+            other = players[1 - turn]
+            drop_phase = plies < 8
+
+            start = time.perf_counter()
+            try:
+                move = mover.make_move(mover.board)
+            except Exception as e:
+                winner = names[1 - turn]
+                reason = 'error: %r' % e
+                break
+            latency[names[turn]].append(time.perf_counter() - start)
+            plies += 1
+
+            try:
+                if len(move) != (1 if drop_phase else 2):
+                    raise Exception('Illegal move: expected a %s' % ('drop' if drop_phase else 'step'))
+                other.opponent_move(move)
+            except Exception as e:
+                winner = names[1 - turn]
+                reason = 'illegal: %s' % e
+                break
+            mover.place_piece(move, mover.my_piece)
+
+            board = Board.from_state(mover.board)
+            win = board.winner()
+            if win is not None:
+                winner = names[win]
+                reason = 'win'
+                break
+            history.push(board.key(1 - turn))
+            reason = rule.check(history, plies)
+    finally:
+        for player in players:
+            player.close()
+
+    return {
+        'game': index,
+        'black': names[0],
+        'winner': winner,
+        'reason': reason,
+        'plies': plies,
+        'latency': latency,
+    }
+
+
+def _play(args):
+    return play_game(*args)
+
+
+def percentile(values, p):
+    """ Returns the p-th percentile (0-100) of a list of numbers, nearest rank. """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(1, math.ceil(p / 100.0 * len(values)))
+    return values[rank - 1]
+
+
+def summarize(records):
+    """ Aggregates game records.
+
+    Returns:
+        dict: results of A, game length statistics and move latency percentiles
+    """
+    n = len(records)
+    wins = sum(1 for r in records if r['winner'] == 'A')
+    losses = sum(1 for r in records if r['winner'] == 'B')
+    draws = n - wins - losses
+    lengths = [r['plies'] for r in records]
+    histogram = {}
+    for length in lengths:
+        bucket = length // 10 * 10
+        histogram[bucket] = histogram.get(bucket, 0) + 1
+    summary = {
+        'games': n,
+        'a_win_rate': wins / n if n else 0.0,
+        'a_loss_rate': losses / n if n else 0.0,
+        'draw_rate': draws / n if n else 0.0,
+        'illegal': sum(1 for r in records if r['reason'].startswith('illegal')),
+        'errors': sum(1 for r in records if r['reason'].startswith('error')),
+        'length': {
+            'min': min(lengths) if lengths else None,
+            'median': percentile(lengths, 50),
+            'mean': sum(lengths) / n if n else None,
+            'max': max(lengths) if lengths else None,
+            'histogram': {'%d-%d' % (b, b + 9): histogram[b] for b in sorted(histogram)},
+        },
+        'latency': {},
+    }
+    for name in ('A', 'B'):
+        times = [t for r in records for t in r['latency'][name]]
+        summary['latency'][name] = {
+            'moves': len(times),
+            'p50': percentile(times, 50),
+            'p90': percentile(times, 90),
+            'p99': percentile(times, 99),
+            'max': max(times) if times else None,
+        }
+    return summary
+
+
+def _read_results(path):
+    meta = None
+    records = []
+    if not os.path.exists(path):
+        return meta, records
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                # the last line of an interrupted run may be incomplete
+                continue
+            if 'arena' in item:
+                meta = item['arena']
+            else:
+                records.append(item)
+    return meta, records
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+def run(games, config_a, config_b, out, workers=None, max_plies=DEFAULT_MAX_PLIES, seed=0,
+        repetitions=DEFAULT_REPETITIONS, log=None):
+    """ Plays games until the results file holds the requested number.
+
+    Args:
+        games (int): total number of games
+        config_a (dict): Teeko2Player keyword arguments of A
+        config_b (dict): Teeko2Player keyword arguments of B
+        out (str): JSONL results file, resumed if it exists
+        workers (int): number of processes, defaults to the number of CPUs
+        max_plies (int): number of plies after which a game is a draw
+        seed (int): base seed of the players' random choices
+        repetitions (int): number of occurrences of a position that make a game a
+            draw, 0 to play on
+        log (callable): optional function called with progress messages
+
+    Returns:
+        list: the records of all games in the results file
+    """
+    log = log or (lambda message: None)
+    meta = {'a': config_a, 'b': config_b, 'max_plies': max_plies, 'seed': seed, 'repetitions': repetitions}
+    old_meta, records = _read_results(out)
+    if old_meta is not None and old_meta != meta:
+        raise ValueError('%s holds results of a different match: %s' % (out, json.dumps(old_meta)))
+    done = {r['game'] for r in records}
+    todo = [(i, config_a, config_b, max_plies, seed, repetitions) for i in range(games) if i not in done]
+    log('%d games done, %d to play' % (len(done), len(todo)))
+
+    with open(out, 'a') as f:
+        if f.tell() and not _ends_with_newline(out):
+            f.write('\n')
+        if old_meta is None:
+            f.write(json.dumps({'arena': meta}) + '\n')
+            f.flush()
+        if todo:
+            with multiprocessing.Pool(workers) as pool:
+                for record in pool.imap_unordered(_play, todo):
+                    f.write(json.dumps(record) + '\n')
+                    f.flush()
+                    records.append(record)
+                    if len(records) % 50 == 0:
+                        log('%d/%d games' % (len(records), games))
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Play Teeko2Player configurations against each other.')
+    parser.add_argument('--games', type=int, default=100, help='total number of games')
+    parser.add_argument('--a', default='{}', help='JSON Teeko2Player arguments of A')
+    parser.add_argument('--b', default='{}', help='JSON Teeko2Player arguments of B')
+    parser.add_argument('--out', default='arena.jsonl', help='JSONL results file, resumed if it exists')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes')
+    parser.add_argument('--max-plies', type=int, default=DEFAULT_MAX_PLIES, help='plies before a draw')
+    parser.add_argument('--seed', type=int, default=0, help='base random seed')
+    parser.add_argument('--repetitions', type=int, default=DEFAULT_REPETITIONS,
+                        help='occurrences of a position that make a draw, 0 to play on')
+    args = parser.parse_args(argv)
+
+    records = run(args.games, json.loads(args.a), json.loads(args.b), args.out, args.workers,
+                  args.max_plies, args.seed, args.repetitions, log=lambda message: print(message, file=sys.stderr))
+    print(json.dumps(summarize(records), indent=2))
+
+
+if __name__ == '__main__':
+    main()
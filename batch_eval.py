@@ -0,0 +1,130 @@
+""" Batched NumPy evaluation of Teeko2 leaf positions.
+
+Boards are rows of an (N, 25) integer array holding 0 for an empty square, 1
+for black and 2 for red (player index + 1), squares in row-major order. Every
+win pattern is a row of the WINDOWS index matrix, so one fancy-indexing step
+counts the pieces of every pattern of every board at once.
+
+This module needs numpy, which the rest of the player does not; it is only
+imported when a Teeko2Player is created with batch_leaves=True.
+"""
+
+import numpy as np
+
+from bitboard import CORNER_MASKS, LINE_MASKS, SQUARES
+
+
+def _squares_of(mask):
+    return [sq for sq in range(SQUARES) if mask >> sq & 1]
+
+
+# (37, 4) square indices of the 28 four-in-a-row lines followed by the 9 3x3
+# corner patterns, in the order Teeko2Player.game_value checks them
+WINDOWS = np.array([_squares_of(mask) for mask in LINE_MASKS]
+                   + [_squares_of(corners) for corners, center in CORNER_MASKS], dtype=np.intp)
+
+# center square of each corner pattern, which must be empty for the pattern to count
+CENTERS = np.array([_squares_of(center)[0] for corners, center in CORNER_MASKS], dtype=np.intp)
+
+N_LINES = len(LINE_MASKS)
+
+# pieces in an open pattern -> score of the pattern
+_SCORES = np.array([0, 0, 1, 3, 0], dtype=np.int64)
+
+_SHIFTS = np.arange(SQUARES, dtype=np.int64)
+
+
+def encode(black, red):
+    """ Unpacks bitboards into the (N, 25) board array.
+
+    Args:
+        black (array-like): N bitboards of the black pieces
+        red (array-like): N bitboards of the red pieces
+
+    Returns:
+        np.ndarray: (N, 25) int8 array with 0 empty, 1 black, 2 red
+    """
+    black = np.asarray(black, dtype=np.int64).reshape(-1, 1)
+    red = np.asarray(red, dtype=np.int64).reshape(-1, 1)
+    return (((black >> _SHIFTS) & 1) + 2 * ((red >> _SHIFTS) & 1)).astype(np.int8)
+
+
+def window_counts(boards):
+    """ Counts the pieces of every pattern of many boards.
+
+    Args:
+        boards (np.ndarray): (N, 25) array, 0 empty, 1 black, 2 red
+
+    Returns:
+        tuple: (black, red, active) (N, 37) arrays of the black and red pieces of
+            every pattern and whether the pattern can count (a corner pattern
+            only counts with an empty center)
+    """
+    boards = np.asarray(boards)
+    windows = boards[:, WINDOWS]                            # (N, 37, 4)
+    black = (windows == 1).sum(axis=2)                      # (N, 37)
+    red = (windows == 2).sum(axis=2)
+    active = np.ones(black.shape, dtype=bool)
+    active[:, N_LINES:] = boards[:, CENTERS] == 0
+    return black, red, active
+
+
+def terminal_values(black, red, active, player):
+    """ Finds the won boards among counted boards.
+
+    Args:
+        black, red, active: the result of window_counts()
+        player (int): 0 for black, 1 for red
+
+    Returns:
+        tuple: (won, value) N arrays: whether the board is won, and 1 or -1 for
+            a board won or lost by player; the first winning pattern in
+            game_value order decides
+    """
+    black_win = (black == 4) & active
+    red_win = (red == 4) & active
+    any_win = black_win | red_win
+    won = any_win.any(axis=1)
+    first = any_win.argmax(axis=1)
+    black_first = black_win[np.arange(len(black)), first]
+    return won, np.where(black_first == (player == 0), 1.0, -1.0)
+
+
+def evaluate_batch(boards, player):
+    """ Scores many boards at once from the given player's point of view.
+
+    The result for every board is exactly Board.evaluate(player): 1 or -1 for a
+    won or lost board (the first winning pattern in game_value order decides),
+    otherwise (2 / (sum_player + sum_opp + 1)) * sum_player - 1 where every open
+    pattern counts 1 for 2 pieces and 3 for 3 pieces, or 0.0 if nothing counts.
+
+    Args:
+        boards (np.ndarray): (N, 25) array, 0 empty, 1 black, 2 red
+        player (int): 0 for black, 1 for red
+
+    Returns:
+        np.ndarray: N float64 values
+    """
+    black, red, active = window_counts(boards)
+    won, winner_value = terminal_values(black, red, active, player)
+
+    if player == 0:
+        mine, theirs = black, red
+    else:
+        mine, theirs = red, black
+    sum_player = (_SCORES[mine] * ((theirs == 0) & active)).sum(axis=1)
+    sum_opp = (_SCORES[theirs] * ((mine == 0) & active)).sum(axis=1)
+
+    total = sum_player + sum_opp
+    with np.errstate(divide='ignore', invalid='ignore'):
+        heuristic = np.where(total == 0, 0.0, (2.0 / (total + 1)) * sum_player - 1)
+    return np.where(won, winner_value, heuristic)
+
+
+def evaluate_bits(black, red, player, mover=None):
+    """ evaluate_batch() for boards given as arrays of black and red bitboards.
+
+    mover, the player who just moved, is ignored: the heuristic doesn't depend
+    on it, but value_net.ValueNet.evaluate_bits() does.
+    """
+    return evaluate_batch(encode(black, red), player)
@@ -0,0 +1,238 @@
+""" Reproducible benchmark of the Teeko2Player search.
+
+A fixed corpus of drop-phase and movement-phase positions is generated from a
+seed by playing random legal moves. Every stage (game_value,
+heuristic_game_value, succ and a fixed-depth make_move) is timed on the whole
+corpus, and the results can be compared against a stored baseline:
+
+    python bench.py --save-baseline            # record bench_baseline.json
+    python bench.py                            # compare, exit 1 on a regression
+
+Reported per stage: calls, seconds per call, nodes per second (a node is one
+call for the first three stages and one searched position for make_move) and
+allocated bytes per node. Python has no cumulative allocation counter, so the
+latter is the peak of the memory traced by tracemalloc during the stage divided
+by its nodes. For make_move the chosen moves are also compared with the ones
+stored in the baseline.
+
+Players are created with a fixed piece, no opening book or endgame table and a
+fixed depth, so runs don't depend on Teeko2Player's random color or the clock.
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+from bitboard import Board
+from game import Teeko2Player
+
+BASELINE_FILE = 'bench_baseline.json'
+
+STAGES = ('game_value', 'heuristic_game_value', 'succ', 'make_move')
+
+
+def make_corpus(seed=0, drop_positions=20, move_positions=20):
+    """ Generates the benchmark positions.
+
+    Returns:
+        list: (state, player) pairs, state a list of lists and player the index
+            in Teeko2Player.pieces of the side to move; drop-phase positions first
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for count, low, high in ((drop_positions, 0, 7), (move_positions, 8, 40)):
+        while count:
+            plies = rng.randint(low, high)
+            board = Board()
+            player = 0
+            for ply in range(plies):
+                board.apply(rng.choice(list(board.moves(player))), player)
+                player = 1 - player
+                if board.winner() is not None:
+                    break
+            if board.winner() is not None or not list(board.moves(player)):
+                continue
+            corpus.append((board.to_state(), player))
+            count -= 1
+    return corpus
+
+
+# transposition table size of the benchmarked players, small enough that creating
+# one per position stays cheap
+BENCH_TT_BYTES = 4 * 1024 * 1024
+
+
+def _player(player, depth):
+    return Teeko2Player(time_limit=1e9, max_depth=depth, piece=Teeko2Player.pieces[player],
+                        tt_bytes=BENCH_TT_BYTES, endgame_path=None, book_path=None,
+                        value_net=None)
+
+
+def _run_stage(stage, corpus, depth, trace=False):
+    # returns (seconds, nodes, moves, peak traced bytes); moves only for make_move.
+    # Players are created before the clock and the tracing start.
+    evaluator = _player(0, depth)
+    searchers = [_player(player, depth) for state, player in corpus] if stage == 'make_move' else []
+    nodes = 0
+    moves = []
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        for i, (state, player) in enumerate(corpus):
+            if stage == 'game_value':
+                evaluator.game_value(state)
+                nodes += 1
+            elif stage == 'heuristic_game_value':
+                evaluator.heuristic_game_value(state)
+                nodes += 1
+            elif stage == 'succ':
+                evaluator.succ(state, player)
+                nodes += 1
+            else:
+                moves.append(searchers[i].make_move(state))
+                nodes += searchers[i].nodes
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace else None
+    finally:
+        if trace:
+            tracemalloc.stop()
+    return elapsed, nodes, moves, peak
+
+
+def run_stage(stage, corpus, depth=3, repeat=3):
+    """ Benchmarks one stage on the corpus.
+
+    Args:
+        stage (str): one of STAGES
+        corpus (list): positions from make_corpus()
+        depth (int): search depth of make_move
+        repeat (int): timed runs; the fastest one counts
+
+    Returns:
+        dict: the measurements of the stage
+    """
+    best = None
+    for i in range(repeat):
+        elapsed, nodes, moves, _ = _run_stage(stage, corpus, depth)
+        best = elapsed if best is None else min(best, elapsed)
+    peak = _run_stage(stage, corpus, depth, trace=True)[3]
+
+    result = {
+        'calls': len(corpus),
+        'nodes': nodes,
+        'seconds_per_call': best / len(corpus),
+        'nodes_per_second': nodes / best if best else None,
+        'alloc_bytes_per_node': peak / nodes if nodes else None,
+    }
+    if stage == 'make_move':
+        result['moves'] = [[list(square) for square in move] for move in moves]
+    return result
+
+
+def run(seed=0, drop_positions=20, move_positions=20, depth=3, repeat=3, stages=STAGES, log=None):
+    """ Benchmarks the given stages.
+
+    Returns:
+        dict: the settings and the per-stage results, the format of a baseline
+    """
+    log = log or (lambda message: None)
+    corpus = make_corpus(seed, drop_positions, move_positions)
+    report = {
+        'settings': {'seed': seed, 'drop_positions': drop_positions,
+                     'move_positions': move_positions, 'depth': depth},
+        'stages': {},
+    }
+    for stage in stages:
+        report['stages'][stage] = run_stage(stage, corpus, depth, repeat)
+        log('%-22s %10.1f nodes/s %12.6f s/call' % (stage, report['stages'][stage]['nodes_per_second'],
+                                                   report['stages'][stage]['seconds_per_call']))
+    return report
+
+
+def compare(report, baseline, threshold=0.10, alloc_threshold=0.25, min_agreement=1.0):
+    """ Compares a report with a baseline.
+
+    Args:
+        report (dict): result of run()
+        baseline (dict): an earlier result of run() with the same settings
+        threshold (float): tolerated relative loss of nodes per second and
+            relative increase of seconds per call
+        alloc_threshold (float): tolerated relative increase of bytes per node
+        min_agreement (float): required fraction of make_move moves equal to
+            the baseline's
+
+    Returns:
+        list: messages describing the regressions, empty if there are none
+    """
+    if report['settings'] != baseline['settings']:
+        return ['settings differ from the baseline: %s' % json.dumps(baseline['settings'])]
+    regressions = []
+    for stage, result in report['stages'].items():
+        old = baseline['stages'].get(stage)
+        if old is None:
+            continue
+        if result['nodes_per_second'] < old['nodes_per_second'] * (1 - threshold):
+            regressions.append('%s: %.1f nodes/s, baseline %.1f'
+                               % (stage, result['nodes_per_second'], old['nodes_per_second']))
+        if result['seconds_per_call'] > old['seconds_per_call'] * (1 + threshold):
+            regressions.append('%s: %.6f s/call, baseline %.6f'
+                               % (stage, result['seconds_per_call'], old['seconds_per_call']))
+        if result['alloc_bytes_per_node'] > old['alloc_bytes_per_node'] * (1 + alloc_threshold):
+            regressions.append('%s: %.1f bytes/node, baseline %.1f'
+                               % (stage, result['alloc_bytes_per_node'], old['alloc_bytes_per_node']))
+        if 'moves' in result and 'moves' in old:
+            same = sum(1 for a, b in zip(result['moves'], old['moves']) if a == b)
+            agreement = same / len(old['moves']) if old['moves'] else 1.0
+            result['move_agreement'] = agreement
+            if agreement < min_agreement:
+                regressions.append('%s: %.0f%% of moves agree with the baseline'
+                                   % (stage, 100 * agreement))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Teeko2Player search.')
+    parser.add_argument('--seed', type=int, default=0, help='corpus seed')
+    parser.add_argument('--drop', type=int, default=20, help='number of drop-phase positions')
+    parser.add_argument('--move', type=int, default=20, help='number of movement-phase positions')
+    parser.add_argument('--depth', type=int, default=3, help='make_move search depth')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage, the fastest counts')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='tolerated relative slowdown')
+    parser.add_argument('--alloc-threshold', type=float, default=0.25,
+                        help='tolerated relative growth of bytes per node')
+    parser.add_argument('--min-agreement', type=float, default=1.0,
+                        help='required fraction of moves equal to the baseline')
+    args = parser.parse_args(argv)
+
+    report = run(args.seed, args.drop, args.move, args.depth, args.repeat, args.stages,
+                 log=lambda message: print(message, file=sys.stderr))
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print('wrote %s' % args.baseline)
+        return 0
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(json.dumps(report, indent=2))
+        return 0
+    regressions = compare(report, baseline, args.threshold, args.alloc_threshold, args.min_agreement)
+    for message in regressions:
+        print('REGRESSION ' + message)
+    if not regressions:
+        print('no regressions against %s' % args.baseline)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
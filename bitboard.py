@@ -0,0 +1,521 @@
+""" A compact bitboard representation of a Teeko2 board.
+
+Square (row, col) is bit row*5 + col of a 25-bit integer, and a board is one
+such integer per color. The win patterns of Teeko2 are precomputed as masks so
+that win detection is a handful of AND/compare operations instead of nested
+loops over a list of lists.
+"""
+
+import random
+from collections import namedtuple
+
+PIECES = ['b', 'r']
+EMPTY = ' '
+SIZE = 5
+SQUARES = SIZE * SIZE
+FULL = (1 << SQUARES) - 1
+
+
+def square(row, col):
+    """ Returns the square index of (row, col). """
+    return row * SIZE + col
+
+
+def bit(row, col):
+    """ Returns the single-bit mask of (row, col). """
+    return 1 << (row * SIZE + col)
+
+
+def _mask(cells):
+    mask = 0
+    for row, col in cells:
+        mask |= bit(row, col)
+    return mask
+
+
+def _line_cells():
+    # same order as the checks in Teeko2Player.game_value
+    lines = []
+    # horizontal
+    for i in range(SIZE):
+        for j in range(2):
+            lines.append([(i, j + k) for k in range(4)])
+    # vertical
+    for j in range(SIZE):
+        for i in range(2):
+            lines.append([(i + k, j) for k in range(4)])
+    # \ diagonal
+    for i in range(2):
+        for j in range(2):
+            lines.append([(i + k, j + k) for k in range(4)])
+    # / diagonal
+    for i in range(3, 5):
+        for j in range(2):
+            lines.append([(i - k, j + k) for k in range(4)])
+    return lines
+
+
+def _corner_cells():
+    # (corners, center) of every 3x3 square
+    corners = []
+    for i in range(1, 4):
+        for j in range(1, 4):
+            corners.append(([(i - 1, j - 1), (i - 1, j + 1), (i + 1, j - 1), (i + 1, j + 1)], (i, j)))
+    return corners
+
+
+# four-in-a-row masks
+LINE_MASKS = tuple(_mask(cells) for cells in _line_cells())
+
+# (corners mask, empty center mask) of the 3x3 square patterns
+CORNER_MASKS = tuple((_mask(cells), bit(*center)) for cells, center in _corner_cells())
+
+# every winning pattern as (squares mask, mask of the square that must stay empty)
+WINDOWS = tuple((mask, 0) for mask in LINE_MASKS) + CORNER_MASKS
+
+
+def _neighbors(sq):
+    # same direction order as the original Teeko2Player.succ:
+    # up, down, left, right, up-left, up-right, down-right, down-left
+    row, col = divmod(sq, SIZE)
+    result = []
+    for dr, dc in ((-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, 1), (1, -1)):
+        r, c = row + dr, col + dc
+        if 0 <= r < SIZE and 0 <= c < SIZE:
+            result.append(square(r, c))
+    return tuple(result)
+
+
+# adjacent squares of every square, no wrapping around the edges
+NEIGHBORS = tuple(_neighbors(sq) for sq in range(SQUARES))
+
+
+def _symmetries():
+    # square permutations of the 8 rotations and reflections of the board:
+    # bit 2 transposes, bit 1 flips the rows, bit 0 flips the columns
+    perms = []
+    for t in range(8):
+        perm = []
+        for sq in range(SQUARES):
+            r, c = divmod(sq, SIZE)
+            if t & 4:
+                r, c = c, r
+            if t & 2:
+                r = SIZE - 1 - r
+            if t & 1:
+                c = SIZE - 1 - c
+            perm.append(square(r, c))
+        perms.append(tuple(perm))
+    return tuple(perms)
+
+
+# SYMMETRIES[t][sq] is the image of square sq under the t-th symmetry of the board;
+# they map the win patterns onto each other. SYMMETRIES[0] is the identity.
+SYMMETRIES = _symmetries()
+
+
+def _zobrist_keys():
+    # a fixed seed keeps hashes identical across processes and runs
+    rng = random.Random(0x7EE402)
+    return tuple(tuple(rng.getrandbits(64) for sq in range(SQUARES)) for player in range(2))
+
+
+# ZOBRIST[player][sq] is XORed into a board's hash for every piece of player on sq
+ZOBRIST = _zobrist_keys()
+
+# SIDE_KEYS[player] is XORed into a board's hash to key the position with player to move
+SIDE_KEYS = (0, random.Random(0x51DE).getrandbits(64))
+
+HASH_BITS = 64
+HASH_MASK = (1 << HASH_BITS) - 1
+
+# the key of a piece in the hashes of all 8 symmetric images of the board, packed
+# into one integer: bits 64*t .. 64*t+63 hold the key of its image under SYMMETRIES[t]
+_PACKED_KEYS = tuple(tuple(sum(ZOBRIST[player][perm[sq]] << (HASH_BITS * t)
+                               for t, perm in enumerate(SYMMETRIES))
+                           for sq in range(SQUARES))
+                     for player in range(2))
+
+
+def zobrist_hash(black, red):
+    """ Returns the packed Zobrist hashes of a board given as two bitboards.
+
+    The low 64 bits are the hash of the board itself, the t-th 64-bit field
+    the hash of its image under SYMMETRIES[t].
+    """
+    h = 0
+    for player, bits in ((0, black), (1, red)):
+        keys = _PACKED_KEYS[player]
+        while bits:
+            low = bits & -bits
+            bits ^= low
+            h ^= keys[low.bit_length() - 1]
+    return h
+
+
+class Move(namedtuple('Move', ['dst', 'src', 'mask', 'keys'])):
+    """ A compact move: a drop on square dst (src is None) or a step from src to dst.
+
+    mask is the XOR mask that applies (and undoes) the move on the mover's bitboard,
+    keys[player] the matching XOR delta of the board's packed Zobrist hashes.
+    Moves are interned, so use drop_move() and step_move() instead of the constructor.
+    """
+    __slots__ = ()
+
+    def to_list(self):
+        """ Returns the move in Teeko2Player's [(row, col), (source_row, source_col)] format. """
+        if self.src is None:
+            return [divmod(self.dst, SIZE)]
+        return [divmod(self.dst, SIZE), divmod(self.src, SIZE)]
+
+    @staticmethod
+    def from_list(move):
+        """ Returns the Move for a [(row, col), (source_row, source_col)] move list. """
+        dst = square(move[0][0], move[0][1])
+        if len(move) > 1 and move[1][0] is not None:
+            return step_move(square(move[1][0], move[1][1]), dst)
+        return drop_move(dst)
+
+
+_DROPS = tuple(Move(sq, None, 1 << sq, (_PACKED_KEYS[0][sq], _PACKED_KEYS[1][sq]))
+               for sq in range(SQUARES))
+_STEPS = tuple(tuple(Move(dst, src, (1 << src) | (1 << dst),
+                          (_PACKED_KEYS[0][src] ^ _PACKED_KEYS[0][dst],
+                           _PACKED_KEYS[1][src] ^ _PACKED_KEYS[1][dst]))
+                     for dst in NEIGHBORS[src])
+               for src in range(SQUARES))
+_STEP_INDEX = {(m.src, m.dst): m for steps in _STEPS for m in steps}
+
+
+def drop_move(sq):
+    """ Returns the move that drops a piece on square sq. """
+    return _DROPS[sq]
+
+
+def step_move(src, dst):
+    """ Returns the move from square src to the adjacent square dst. """
+    return _STEP_INDEX[(src, dst)]
+
+
+def winner(black, red):
+    """ Checks two bitboards for a win condition.
+
+    Patterns are checked in the same order as Teeko2Player.game_value, so that
+    the result is identical even for (unreachable) boards where both colors
+    have a winning pattern.
+
+    Args:
+        black (int): bitboard of the black pieces
+        red (int): bitboard of the red pieces
+
+    Returns:
+        int: 0 if black wins, 1 if red wins, None if no winner
+    """
+    for mask in LINE_MASKS:
+        if black & mask == mask:
+            return 0
+        if red & mask == mask:
+            return 1
+    occupied = black | red
+    for corners, center in CORNER_MASKS:
+        if occupied & center:
+            continue
+        if black & corners == corners:
+            return 0
+        if red & corners == corners:
+            return 1
+    return None
+
+
+class Board:
+    """ A Teeko2 board stored as one 25-bit integer per color.
+
+    bits[0] holds the black pieces and bits[1] the red pieces, matching the
+    player indices of Teeko2Player.pieces. hash packs the Zobrist hashes of the
+    board and its symmetric images (see zobrist_hash()), kept up to date by
+    apply() and undo() with a single XOR.
+    """
+    __slots__ = ('bits', 'hash')
+
+    def __init__(self, black=0, red=0):
+        self.bits = [black, red]
+        self.hash = zobrist_hash(black, red)
+
+    @classmethod
+    def from_state(cls, state):
+        """ Builds a board from a 5x5 list of lists of 'b', 'r' and ' '. """
+        black = 0
+        red = 0
+        for i in range(SIZE):
+            row = state[i]
+            for j in range(SIZE):
+                cell = row[j]
+                if cell == 'b':
+                    black |= 1 << (i * SIZE + j)
+                elif cell == 'r':
+                    red |= 1 << (i * SIZE + j)
+        return cls(black, red)
+
+    def to_state(self):
+        """ Returns the board as a 5x5 list of lists of 'b', 'r' and ' '. """
+        black, red = self.bits
+        state = []
+        for i in range(SIZE):
+            row = []
+            for j in range(SIZE):
+                b = 1 << (i * SIZE + j)
+                if black & b:
+                    row.append('b')
+                elif red & b:
+                    row.append('r')
+                else:
+                    row.append(EMPTY)
+            state.append(row)
+        return state
+
+    def occupied(self):
+        return self.bits[0] | self.bits[1]
+
+    def count(self, player):
+        """ Returns the number of pieces of the given player on the board. """
+        return self.bits[player].bit_count()
+
+    def winner(self):
+        """ Returns 0 if black wins, 1 if red wins, None if no winner. """
+        return winner(self.bits[0], self.bits[1])
+
+    def moves(self, player):
+        """ Lazily generates the legal moves of the given player.
+
+        During the drop phase (less than four pieces of the player on the board)
+        these are drops on every empty square, afterwards steps of any piece to an
+        adjacent empty square. Squares are visited in row-major order.
+
+        Args:
+            player (int): 0 for black, 1 for red
+
+        Yields:
+            Move: the legal moves; the board must not be modified while iterating
+                except through matching apply()/undo() pairs
+        """
+        mine = self.bits[player]
+        occupied = self.bits[0] | self.bits[1]
+        if mine.bit_count() < 4:
+            empty = FULL & ~occupied
+            while empty:
+                low = empty & -empty
+                empty ^= low
+                yield _DROPS[low.bit_length() - 1]
+            return
+
+        while mine:
+            low = mine & -mine
+            mine ^= low
+            for move in _STEPS[low.bit_length() - 1]:
+                if not occupied & (1 << move.dst):
+                    yield move
+
+    def apply(self, move, player):
+        """ Plays a move of the given player in place. """
+        self.bits[player] ^= move.mask
+        self.hash ^= move.keys[player]
+
+    def undo(self, move, player):
+        """ Takes back a move of the given player previously played with apply(). """
+        self.bits[player] ^= move.mask
+        self.hash ^= move.keys[player]
+
+    def key(self, player):
+        """ Returns the hash of this position with the given player to move. """
+        return (self.hash & HASH_MASK) ^ SIDE_KEYS[player]
+
+    def canonical_key(self, player):
+        """ Returns a hash shared by this position and all its symmetric images.
+
+        Returns:
+            tuple: (key, t) where key is the smallest hash of the 8 images, with the
+                given player to move, and t the index in SYMMETRIES of that image
+        """
+        h = self.hash
+        best = h & HASH_MASK
+        best_t = 0
+        for t in range(1, 8):
+            h >>= HASH_BITS
+            field = h & HASH_MASK
+            if field < best:
+                best = field
+                best_t = t
+        return best ^ SIDE_KEYS[player], best_t
+
+    def threats(self):
+        """ Finds the empty squares that would complete a winning pattern.
+
+        Returns:
+            list: one bitboard per player of the squares where a piece of that
+                player would complete a pattern holding 3 of its pieces. A step
+                whose source is part of the pattern doesn't complete it.
+        """
+        black, red = self.bits
+        occupied = black | red
+        black_threats = 0
+        red_threats = 0
+        for mask, center in WINDOWS:
+            if occupied & center:
+                continue
+            missing = mask & ~black
+            if not missing & (missing - 1) and not missing & occupied:
+                black_threats |= missing
+            missing = mask & ~red
+            if not missing & (missing - 1) and not missing & occupied:
+                red_threats |= missing
+        return [black_threats, red_threats]
+
+    def evaluate(self, player):
+        """ Scores the board from the given player's point of view.
+
+        Returns 1 or -1 for a won or lost board, otherwise the heuristic value of
+        Teeko2Player.heuristic_game_value: every open four-square pattern (no
+        opposing piece, and an empty center for the 3x3 corners) with 2 pieces
+        counts 1 and with 3 pieces counts 3.
+
+        Returns:
+            float: a value in [-1, 1]
+        """
+        win = self.winner()
+        if win is not None:
+            return 1 if win == player else -1
+
+        mine = self.bits[player]
+        theirs = self.bits[1 - player]
+        sum_player = 0
+        sum_opp = 0
+        for mask in LINE_MASKS:
+            if not theirs & mask:
+                n = (mine & mask).bit_count()
+                if n == 2:
+                    sum_player += 1
+                elif n == 3:
+                    sum_player += 3
+            elif not mine & mask:
+                n = (theirs & mask).bit_count()
+                if n == 2:
+                    sum_opp += 1
+                elif n == 3:
+                    sum_opp += 3
+        occupied = mine | theirs
+        for corners, center in CORNER_MASKS:
+            if occupied & center:
+                continue
+            if not theirs & corners:
+                n = (mine & corners).bit_count()
+                if n == 2:
+                    sum_player += 1
+                elif n == 3:
+                    sum_player += 3
+            elif not mine & corners:
+                n = (theirs & corners).bit_count()
+                if n == 2:
+                    sum_opp += 1
+                elif n == 3:
+                    sum_opp += 3
+
+        if sum_player + sum_opp == 0:
+            return 0.0
+        return (2.0 / (sum_player + sum_opp + 1)) * sum_player - 1
+
+    def __eq__(self, other):
+        return isinstance(other, Board) and self.bits == other.bits
+
+    def __hash__(self):
+        return hash((self.bits[0], self.bits[1]))
+
+    def __repr__(self):
+        return 'Board(0x%07x, 0x%07x)' % (self.bits[0], self.bits[1])
+
+
+# heuristic weight and win count of an open pattern holding n pieces of one color
+_WEIGHTS = (0, 0, 1, 3, 0)
+_WINS = (0, 0, 0, 0, 1)
+
+
+def _pattern_sums(windows, black, red):
+    # (black weight, red weight, black wins, red wins) summed over the patterns
+    occupied = black | red
+    black_sum = red_sum = black_wins = red_wins = 0
+    for mask, center in windows:
+        if occupied & center:
+            continue
+        b = black & mask
+        r = red & mask
+        if not r:
+            n = b.bit_count()
+            black_sum += _WEIGHTS[n]
+            black_wins += _WINS[n]
+        elif not b:
+            n = r.bit_count()
+            red_sum += _WEIGHTS[n]
+            red_wins += _WINS[n]
+    return black_sum, red_sum, black_wins, red_wins
+
+
+def _touched_windows(squares):
+    # the patterns whose squares or empty center include one of the given squares
+    return tuple((mask, center) for mask, center in WINDOWS if (mask | center) & squares)
+
+
+# patterns whose status a move can change, by move mask (a move's mask is unique)
+_MOVE_WINDOWS = {m.mask: _touched_windows(m.mask) for m in _DROPS + tuple(_STEP_INDEX.values())}
+
+
+class IncrementalBoard(Board):
+    """ A Board that keeps its pattern sums up to date as moves are played.
+
+    sums holds, per color, the heuristic weight of the open patterns of that
+    color followed by the number of patterns it completes (both as counted by
+    Board.evaluate()). apply() only rescans the patterns touching the squares of
+    the move and undo() restores the sums saved by apply(), so winner() and
+    evaluate() don't scan the board. Moves must be undone in reverse order.
+    """
+    __slots__ = ('sums', '_saved')
+
+    def __init__(self, black=0, red=0):
+        super().__init__(black, red)
+        self.sums = _pattern_sums(WINDOWS, black, red)
+        self._saved = []
+
+    def apply(self, move, player):
+        bits = self.bits
+        windows = _MOVE_WINDOWS[move.mask]
+        old = self.sums
+        self._saved.append(old)
+        before = _pattern_sums(windows, bits[0], bits[1])
+        bits[player] ^= move.mask
+        self.hash ^= move.keys[player]
+        after = _pattern_sums(windows, bits[0], bits[1])
+        self.sums = (old[0] + after[0] - before[0], old[1] + after[1] - before[1],
+                     old[2] + after[2] - before[2], old[3] + after[3] - before[3])
+
+    def undo(self, move, player):
+        self.bits[player] ^= move.mask
+        self.hash ^= move.keys[player]
+        self.sums = self._saved.pop()
+
+    def winner(self):
+        sums = self.sums
+        if sums[2]:
+            # both colors can only complete patterns on unreachable boards, where
+            # the scan order of winner() decides
+            return 0 if not sums[3] else winner(self.bits[0], self.bits[1])
+        if sums[3]:
+            return 1
+        return None
+
+    def evaluate(self, player):
+        sums = self.sums
+        if sums[2] or sums[3]:
+            return 1 if self.winner() == player else -1
+        sum_player = sums[player]
+        sum_opp = sums[1 - player]
+        if sum_player + sum_opp == 0:
+            return 0.0
+        return (2.0 / (sum_player + sum_opp + 1)) * sum_player - 1
@@ -0,0 +1,180 @@
+""" Drop-phase opening book for Teeko2Player.
+
+The drop phase has the widest branching of the game (up to 25 drops), so its
+first plies are searched offline, much deeper than a live move can afford, and
+the results are stored in a book file:
+
+    python book.py --plies 4 --time 20 --workers 8
+
+Positions are stored once per class of the board's 8 symmetries (rotations and
+reflections), keyed by their canonical form (see symmetry.py). The book is a
+table file (see tables.py) of records sorted by key, each an 8-byte canonical
+key followed by the 1-byte drop square in the canonical orientation, and is
+binary searched straight from the memory mapping.
+"""
+
+import argparse
+import multiprocessing
+import os
+import struct
+import sys
+import time
+
+from bitboard import SQUARES, Board, drop_move
+from symmetry import INVERSE, canonical, transform_move
+from tables import MappedTable, TableError, write_table
+
+BOOK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'teeko2_book.bin')
+
+# payload tag of opening book files
+KIND = b'BOOK'
+
+RECORD = struct.Struct('<QB')    # canonical key, drop square
+
+
+def side_to_move(board):
+    """ Returns the player to move in the drop phase: black unless it has placed more. """
+    return 1 if board.count(0) > board.count(1) else 0
+
+
+def positions(plies):
+    """ Returns the canonical keys of the drop-phase positions before each of the first plies moves.
+
+    Positions already won are left out.
+    """
+    level = {canonical(0, 0)[0]}
+    result = set(level)
+    for ply in range(1, plies):
+        next_level = set()
+        for key in level:
+            board = Board(key & ((1 << SQUARES) - 1), key >> SQUARES)
+            player = side_to_move(board)
+            for m in board.moves(player):
+                board.apply(m, player)
+                if board.winner() is None:
+                    next_level.add(canonical(*board.bits)[0])
+                board.undo(m, player)
+        level = next_level
+        result |= level
+    return sorted(result)
+
+
+_searcher = None
+
+
+def _init_worker(time_limit, max_depth):
+    global _searcher
+    # imported here, game.py imports this module
+    from game import Teeko2Player
+    _searcher = Teeko2Player(time_limit=time_limit, max_depth=max_depth,
+                             endgame_path=None, book_path=None, value_net=None)
+
+
+def _search(key):
+    board = Board(key & ((1 << SQUARES) - 1), key >> SQUARES)
+    player = side_to_move(board)
+    _searcher.my_piece = _searcher.pieces[player]
+    _searcher.opp = _searcher.pieces[1 - player]
+    _searcher.tt.clear()
+    move = _searcher.iterative_deepening(board, player, time.perf_counter() + _searcher.time_limit)
+    return key, move.dst, _searcher.depth_reached
+
+
+def build(plies, time_limit, max_depth=None, workers=None, log=None):
+    """ Searches every drop-phase position of the first plies moves in parallel.
+
+    Args:
+        plies (int): number of plies the book covers
+        time_limit (float): seconds of search per position
+        max_depth (int): optional depth limit per position
+        workers (int): number of processes, defaults to the number of CPUs
+        log (callable): optional function called with progress messages
+
+    Returns:
+        dict: canonical key -> best drop square in the canonical orientation
+    """
+    log = log or (lambda message: None)
+    keys = positions(plies)
+    log('%d positions to search' % len(keys))
+    book = {}
+    with multiprocessing.Pool(workers, _init_worker, (time_limit, max_depth)) as pool:
+        for done, (key, dst, depth) in enumerate(pool.imap_unordered(_search, keys), 1):
+            book[key] = dst
+            if done % 100 == 0 or done == len(keys):
+                log('%d/%d searched (last depth %d)' % (done, len(keys), depth))
+    return book
+
+
+def write_book(path, book):
+    """ Writes a book built by build() to a table file. """
+    payload = bytearray()
+    for key in sorted(book):
+        payload += RECORD.pack(key, book[key])
+    write_table(path, KIND, payload)
+
+
+class OpeningBook:
+    """ Lookup of drop-phase moves in a memory-mapped book file. """
+
+    def __init__(self, path):
+        """ Maps a book written by write_book(); see tables.MappedTable.
+
+        Raises:
+            TableError: if the file is not a book, or holds a partial record
+        """
+        self.table = MappedTable(path, KIND)
+        if len(self.table.payload) % RECORD.size:
+            self.table.close()
+            raise TableError('%s is not a whole number of book records' % path)
+        self.records = self.table.payload
+        self.size = len(self.records) // RECORD.size
+
+    def _find(self, key):
+        lo = 0
+        hi = self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_key, dst = RECORD.unpack_from(self.records, mid * RECORD.size)
+            if mid_key == key:
+                return dst
+            if mid_key < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def lookup(self, board):
+        """ Returns the book move of a drop-phase position.
+
+        Args:
+            board (Board): the position, with the player from side_to_move() to move
+
+        Returns:
+            Move: the book drop in the orientation of board, or None if the
+                position is not in the book
+        """
+        key, t = canonical(*board.bits)
+        dst = self._find(key)
+        if dst is None:
+            return None
+        # the stored square is in the canonical orientation, map it back
+        return transform_move(drop_move(dst), INVERSE[t])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the Teeko2 drop-phase opening book.')
+    parser.add_argument('--plies', type=int, default=3, help='number of plies the book covers')
+    parser.add_argument('--time', type=float, default=20.0, help='seconds of search per position')
+    parser.add_argument('--depth', type=int, default=None, help='maximum search depth per position')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes')
+    parser.add_argument('--out', default=BOOK_FILE, help='book file to write')
+    args = parser.parse_args(argv)
+
+    book = build(args.plies, args.time, args.depth, args.workers,
+                 log=lambda message: print(message, file=sys.stderr))
+    write_book(args.out, book)
+    print('wrote %s: %d positions' % (args.out, len(book)))
+
+
+if __name__ == '__main__':
+    main()
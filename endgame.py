@@ -0,0 +1,298 @@
+""" Retrograde solution of the Teeko2 movement phase.
+
+Once all eight pieces are down there are C(25,4) * C(21,4) = 75,710,250 ways to
+place four pieces of the side to move and four of the other side, for each of
+the two colors to move. This module solves all of them backwards from the won
+positions and stores one byte per position, addressed by a perfect ranking of
+(side to move, mover's squares, other side's squares):
+
+    0                  draw (neither side can force a win)
+    1 + 2*d + loss     the game ends after d more plies with best play;
+                       loss is 1 if the side to move loses, 0 if it wins
+
+Build the table offline with
+
+    python endgame.py --out teeko2_endgame.bin
+
+and Teeko2Player picks it up from ENDGAME_FILE when it exists.
+"""
+
+import argparse
+import os
+import sys
+import time
+from array import array
+from itertools import combinations
+
+from bitboard import NEIGHBORS, SQUARES, winner
+from tables import MappedTable, TableError, write_table
+
+ENDGAME_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'teeko2_endgame.bin')
+
+# payload tag of endgame table files
+KIND = b'EGDB'
+
+WIN = 1
+DRAW = 0
+LOSS = -1
+
+# longest distance (plies) a value byte can hold
+MAX_DISTANCE = 126
+
+
+def _set_bits(indices, squares=None):
+    bits = 0
+    for i in indices:
+        bits |= 1 << (i if squares is None else squares[i])
+    return bits
+
+
+# rank -> bitboard of the side to move, and the inverse
+MOVER_SETS = [_set_bits(c) for c in combinations(range(SQUARES), 4)]
+MOVER_RANK = {bits: rank for rank, bits in enumerate(MOVER_SETS)}
+
+# the other side's four squares are ranked among the 21 squares the mover leaves
+# free, as a bitboard of indices into that list of free squares
+OTHER_COMBOS = list(combinations(range(SQUARES - 4), 4))
+OTHER_RANK = {_set_bits(c): rank for rank, c in enumerate(OTHER_COMBOS)}
+
+N_MOVER = len(MOVER_SETS)         # 12650
+N_OTHER = len(OTHER_COMBOS)       # 5985
+N_SIDE = N_MOVER * N_OTHER        # positions per side to move
+N_POSITIONS = 2 * N_SIDE
+
+# bitboard of the squares adjacent to each square
+NEIGHBOR_MASKS = tuple(_set_bits(NEIGHBORS[sq]) for sq in range(SQUARES))
+
+
+def _squares(bits):
+    result = []
+    while bits:
+        low = bits & -bits
+        bits ^= low
+        result.append(low.bit_length() - 1)
+    return result
+
+
+def rank(side, mover, other):
+    """ Returns the table index of a movement-phase position.
+
+    Args:
+        side (int): 0 if black is to move, 1 if red is to move
+        mover (int): bitboard of the four pieces of the side to move
+        other (int): bitboard of the four pieces of the other side
+
+    Returns:
+        int: an index in range(N_POSITIONS), unique for every position
+    """
+    compressed = 0
+    bits = other
+    while bits:
+        low = bits & -bits
+        bits ^= low
+        # number of free squares below this one
+        compressed |= low >> (mover & (low - 1)).bit_count()
+    return side * N_SIDE + MOVER_RANK[mover] * N_OTHER + OTHER_RANK[compressed]
+
+
+def unrank(index):
+    """ Inverse of rank().
+
+    Returns:
+        tuple: (side, mover, other)
+    """
+    side, index = divmod(index, N_SIDE)
+    mover_rank, other_rank = divmod(index, N_OTHER)
+    mover = MOVER_SETS[mover_rank]
+    free = [sq for sq in range(SQUARES) if not mover >> sq & 1]
+    return side, mover, _set_bits(OTHER_COMBOS[other_rank], free)
+
+
+def encode(result, distance):
+    """ Packs a (result, distance) pair into a value byte. """
+    if result == DRAW:
+        return 0
+    if distance > MAX_DISTANCE:
+        raise OverflowError('distance %d does not fit in a value byte' % distance)
+    return 1 + 2 * distance + (1 if result == LOSS else 0)
+
+
+def decode(value):
+    """ Unpacks a value byte.
+
+    Returns:
+        tuple: (result, distance) with result WIN, LOSS or DRAW for the side to move
+    """
+    if value == 0:
+        return DRAW, 0
+    value -= 1
+    return (LOSS if value & 1 else WIN), value >> 1
+
+
+def _board_bits(side, mover, other):
+    return (mover, other) if side == 0 else (other, mover)
+
+
+def _count_moves(mover, occupied):
+    count = 0
+    bits = mover
+    while bits:
+        low = bits & -bits
+        bits ^= low
+        count += (NEIGHBOR_MASKS[low.bit_length() - 1] & ~occupied).bit_count()
+    return count
+
+
+def solve(log=None):
+    """ Solves every movement-phase position by retrograde analysis.
+
+    A position is lost for the side to move when the other side already has a
+    winning pattern, and won in the (unreachable) case that only a pattern of
+    the side to move is complete; game_value's checking order decides when
+    both are. Working backwards one ply at a time, a position is won in d+1
+    plies if some move reaches a position lost in d plies for the opponent,
+    and lost in d+1 plies once every move reaches a position the opponent
+    wins. Positions never reached this way, including the ones where the side
+    to move has no legal move, are draws.
+
+    Args:
+        log (callable): optional function called with progress messages
+
+    Returns:
+        bytearray: one value byte per position index
+    """
+    log = log or (lambda message: None)
+    start = time.time()
+    values = bytearray(N_POSITIONS)
+    remaining = bytearray(N_POSITIONS)   # unsolved successors of every position
+    frontier = array('I')
+
+    for side in range(2):
+        for mover_rank, mover in enumerate(MOVER_SETS):
+            free = [sq for sq in range(SQUARES) if not mover >> sq & 1]
+            base = side * N_SIDE + mover_rank * N_OTHER
+            for other_rank, combo in enumerate(OTHER_COMBOS):
+                other = 1 << free[combo[0]] | 1 << free[combo[1]] | 1 << free[combo[2]] | 1 << free[combo[3]]
+                black, red = _board_bits(side, mover, other)
+                win = winner(black, red)
+                if win is not None:
+                    values[base + other_rank] = encode(WIN if win == side else LOSS, 0)
+                    frontier.append(base + other_rank)
+                else:
+                    remaining[base + other_rank] = _count_moves(mover, mover | other)
+            if mover_rank % 1000 == 0:
+                log('side %d: ranked %d/%d mover sets (%.0fs)' % (side, mover_rank, N_MOVER, time.time() - start))
+    log('%d terminal positions' % len(frontier))
+
+    distance = 0
+    while frontier:
+        next_frontier = array('I')
+        for index in frontier:
+            side, mover, other = unrank(index)
+            lost = decode(values[index])[0] == LOSS
+            occupied = mover | other
+            # undo a move of the other side: one of its pieces came from an adjacent empty square
+            for sq in _squares(other):
+                for src in NEIGHBORS[sq]:
+                    if occupied >> src & 1:
+                        continue
+                    prev = rank(1 - side, other ^ (1 << sq) ^ (1 << src), mover)
+                    if values[prev]:
+                        continue
+                    if lost:
+                        values[prev] = encode(WIN, distance + 1)
+                        next_frontier.append(prev)
+                    else:
+                        remaining[prev] -= 1
+                        if not remaining[prev]:
+                            values[prev] = encode(LOSS, distance + 1)
+                            next_frontier.append(prev)
+        distance += 1
+        frontier = next_frontier
+        log('distance %d: %d positions (%.0fs)' % (distance, len(frontier), time.time() - start))
+    return values
+
+
+class EndgameTable:
+    """ Read access to a solved movement-phase table. """
+
+    def __init__(self, values):
+        """ Args:
+            values (bytes-like): one value byte per position index
+        """
+        if len(values) != N_POSITIONS:
+            raise ValueError('expected %d positions, got %d' % (N_POSITIONS, len(values)))
+        self.values = values
+
+    @classmethod
+    def open(cls, path):
+        """ Maps a table file written by main(); see tables.MappedTable.
+
+        Raises:
+            TableError: if the file is not a table of this kind, or not of the
+                size of a complete one
+        """
+        table = MappedTable(path, KIND)
+        size = len(table.payload)
+        if size != N_POSITIONS:
+            table.close()
+            raise TableError('%s holds %d positions, expected %d' % (path, size, N_POSITIONS))
+        return cls(table.payload)
+
+    def probe(self, board, player):
+        """ Looks up a position with all eight pieces down.
+
+        Args:
+            board (Board): the position
+            player (int): 0 if black is to move, 1 if red is to move
+
+        Returns:
+            tuple: (result, distance) for the player to move, see decode()
+        """
+        return decode(self.values[rank(player, board.bits[player], board.bits[1 - player])])
+
+    def best_move(self, board, player):
+        """ Picks a perfect move: the fastest win, else a draw, else the slowest loss.
+
+        Args:
+            board (Board): the position, left unchanged
+            player (int): 0 if black is to move, 1 if red is to move
+
+        Returns:
+            Move: the chosen move, or None if the player has no legal move
+        """
+        best = None
+        best_score = None
+        for m in board.moves(player):
+            board.apply(m, player)
+            result, distance = self.probe(board, 1 - player)
+            board.undo(m, player)
+            # rank moves by (outcome, speed): wins first and fast, losses last and slow
+            if result == LOSS:
+                score = (2, -distance)
+            elif result == DRAW:
+                score = (1, 0)
+            else:
+                score = (0, distance)
+            if best_score is None or score > best_score:
+                best_score = score
+                best = m
+        return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Solve the Teeko2 movement phase.')
+    parser.add_argument('--out', default=ENDGAME_FILE, help='table file to write')
+    args = parser.parse_args(argv)
+
+    values = solve(log=lambda message: print(message, file=sys.stderr))
+    write_table(args.out, KIND, values)
+    results = [0, 0, 0]
+    for value in values:
+        results[decode(value)[0] + 1] += 1
+    print('wrote %s: %d wins, %d draws, %d losses for the side to move'
+          % (args.out, results[2], results[1], results[0]))
+
+
+if __name__ == '__main__':
+    main()
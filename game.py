@@ -1,21 +1,137 @@
+import logging
+import os
 import random
-import copy
 import time
+import zipfile
+
+from bitboard import HASH_MASK, SIDE_KEYS, Board, IncrementalBoard
+from book import BOOK_FILE, OpeningBook, side_to_move
+from endgame import ENDGAME_FILE, EndgameTable
+from instrument import SearchStats
+from repetition import DrawRule, PositionHistory
+from symmetry import INVERSE, transform_move
+from tables import TableError
+from transposition import DEFAULT_TT_BYTES, EXACT, LOWER, UPPER, TranspositionTable
+
+try:
+    from value_net import VALUE_NET_FILE
+except ImportError:
+    # without numpy there is no value network to load
+    VALUE_NET_FILE = None
+
+logger = logging.getLogger('teeko2')
+
+# seconds a Teeko2Player may spend on one move unless told otherwise
+DEFAULT_TIME_LIMIT = 3.0
+
+# the clock is checked once every NODE_CHECK_INTERVAL nodes; a threshold rather
+# than a mask, as the batched leaf evaluation counts a whole set of children at once
+NODE_CHECK_INTERVAL = 1024
+
+# move ordering: moves completing a pattern of the mover come first, then moves
+# blocking one of the opponent's, then the killer moves of the ply, and the
+# history table orders the rest (and moves within each class)
+WIN_SCORE = 1 << 42
+BLOCK_SCORE = 1 << 41
+KILLER_SCORE = 1 << 40
+
+
+class SearchTimeout(Exception):
+    """ Raised inside the search when the time budget of a move is used up. """
+
 
 class Teeko2Player:
     """ An object representation for an AI game player for the game Teeko2.
     """
-    board = [[' ' for j in range(5)] for i in range(5)]
     pieces = ['b', 'r']
 
-    def __init__(self):
+    def __init__(self, time_limit=DEFAULT_TIME_LIMIT, max_depth=None, tt_bytes=DEFAULT_TT_BYTES,
+                 batch_leaves=False, endgame_path=ENDGAME_FILE, book_path=BOOK_FILE, workers=1,
+                 piece=None, stats_sink=None, value_net=VALUE_NET_FILE):
         """ Initializes a Teeko2Player object by randomly selecting red or black as its
-        piece color.
+        piece color, unless a piece is given.
+
+        Args:
+            time_limit (float): seconds the search may spend on each move
+            max_depth (int): optional limit on the iterative deepening depth (plies)
+            tt_bytes (int): memory cap of the transposition table, which is kept for
+                the whole game
+            batch_leaves (bool): score all leaf children of a node with one batched
+                NumPy call (batch_eval.py) instead of one evaluation per leaf
+            endgame_path (str): solved movement-phase table (see endgame.py) used
+                instead of searching once all pieces are down; the player searches
+                when the file does not exist
+            book_path (str): drop-phase opening book (see book.py) consulted before
+                searching, if the file exists
+            workers (int): number of processes searching the root moves in parallel
+                (see parallel.py); the processes are started by the first search and
+                kept until close()
+            piece (str): 'b' or 'r' to play a given color instead of a random one
+            stats_sink: optional object whose emit() method receives the SearchStats
+                of every move (see instrument.py); without one the search keeps no
+                statistics beyond its node count
+            value_net (str): weights file of a value network (see value_net.py) that
+                scores the leaves of the search instead of the heuristic, if the
+                file exists; implies batch_leaves
         """
-        self.my_piece = random.choice(self.pieces)
+        # every game has a board of its own
+        self.board = [[' ' for j in range(5)] for i in range(5)]
+        self.my_piece = piece if piece is not None else random.choice(self.pieces)
         self.opp = self.pieces[0] if self.my_piece == self.pieces[1] else self.pieces[1]
-
-    def make_move(self, state):
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.tt = TranspositionTable(tt_bytes)
+        # a stale or damaged table or network is ignored like a missing one, the
+        # search covers its positions anyway with the heuristic
+        self.batch_eval = None
+        self._value_net = None
+        if value_net is not None and os.path.exists(value_net):
+            try:
+                from value_net import ValueNet
+                self.batch_eval = ValueNet.load(value_net)
+                self._value_net = value_net
+            except (ImportError, OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+                logger.warning('not using the value network: %s', e)
+        if self.batch_eval is None and batch_leaves:
+            # numpy is only needed for the batched evaluator
+            import batch_eval
+            self.batch_eval = batch_eval
+        self.endgame = None
+        if endgame_path is not None and os.path.exists(endgame_path):
+            try:
+                self.endgame = EndgameTable.open(endgame_path)
+            except (TableError, OSError) as e:
+                logger.warning('not using the endgame table: %s', e)
+        self.book = None
+        if book_path is not None and os.path.exists(book_path):
+            try:
+                self.book = OpeningBook(book_path)
+            except (TableError, OSError) as e:
+                logger.warning('not using the opening book: %s', e)
+        self.workers = workers
+        self._tt_bytes = tt_bytes
+        self._pool = None
+        self.stats_sink = stats_sink
+        # history heuristic, per player: Move -> score of the cutoffs it caused.
+        # Kept for the whole game and halved at the start of every move.
+        self.history = ({}, {})
+        # the last two moves that caused a cutoff at each ply of the current move
+        self._killers = []
+        # keys of the positions of the game, and of the line being searched on top
+        # of them during a search
+        self.positions = PositionHistory()
+        self._last_bits = None
+        # search state of the move being computed
+        self.nodes = 0
+        self.depth_reached = 0
+        self._next_check = NODE_CHECK_INTERVAL
+        self._deadline = None
+        self._depth_limit = 0
+        self._me = 0
+        self._horizon = False
+        self._stats = None
+
+    def make_move(self, state, time_limit=None):
         """ Selects a (row, col) space for the next move. You may assume that whenever
         this function is called, it is this player's turn to move.
 
@@ -28,6 +144,8 @@ class Teeko2Player:
 
                 In the "drop phase", the state will contain less than 8 elements which
                 are not ' ' (a single space character).
+            time_limit (float): seconds to spend on this move, defaults to the
+                time_limit given to the constructor
 
         Return:
             move (list): a list of move tuples such that its format is
@@ -41,61 +159,272 @@ class Teeko2Player:
             and will eventually take over the board. This is not a valid strategy and
             will earn you no points.
         """
+        if self.stats_sink is not None:
+            return self.make_move_with_stats(state, time_limit)[0]
+        return self.select_move(Board.from_state(state), time_limit)[0].to_list()
 
+    def make_move_with_stats(self, state, time_limit=None):
+        """ Same as make_move(), and also reports how the move was computed.
 
-        drop_phase = True
-        # count the number of ai's piece and empty spot
-        count = 0
-        empty_count = 0
+        The statistics are passed to the stats_sink given to the constructor, if any.
 
-        for i in range(5):
-            for j in range(5):
-                if state[i][j] == self.my_piece:
-                    count += 1
-                if state[i][j] == ' ':
-                    empty_count += 1
+        Returns:
+            tuple: (move, stats) where move is make_move()'s result and stats the
+                SearchStats of its computation
+        """
+        stats = SearchStats()
+        self._stats = stats
+        try:
+            move, stats.source = self.select_move(Board.from_state(state), time_limit)
+        finally:
+            self._stats = None
+        move = move.to_list()
+        stats.finish(move, self.nodes, self.depth_reached)
+        if self.stats_sink is not None:
+            self.stats_sink.emit(stats)
+        return move, stats
+
+    def select_move(self, board, time_limit=None):
+        """ Chooses this player's move from the book, the endgame table or a search.
 
-        # I use a trick position (2, 2) when AI goes first, the position is computed by a "smarter" AI
-        # using a min_max() function with a deeper depth (ex. depth = 3) when it goes first. Computing
-        # this position(2, 2) consumes more than 5 seconds so I just simply assume AI will choose it as
-        # this first place to go. It makes a "simpler" AI (depth = 2) with a shallower depth more likely
-        # to win in the future
-        if empty_count == 25:
-            return [(2, 2)]
+        Args:
+            board (Board): the current position, left unchanged
+            time_limit (float): seconds to spend searching, defaults to self.time_limit
 
-        if count == 4:
-            drop_phase = False
+        Returns:
+            tuple: (move, source) where move is a Move and source is 'book',
+                'endgame' or 'search'
+        """
+        player = self.pieces.index(self.my_piece)
+        self.nodes = 0
+        self.depth_reached = 0
+        self.record_position(board, player)
+        move, source = self._select_move(board, player, time_limit)
+        board.apply(move, player)
+        self.positions.push(board.key(1 - player))
+        self._last_bits = tuple(board.bits)
+        board.undo(move, player)
+        return move, source
+
+    def record_position(self, board, player):
+        """ Adds the position to move from to the game's positions.
+
+        The positions are started over when the board doesn't follow from the
+        position after this player's last move by one opponent move, as when the
+        player is given the board of another game, unless load_positions() gave
+        them already.
+        """
+        position = board.key(player)
+        if self.positions.keys and self.positions.keys[-1] == position:
+            return
+        if self._last_bits is None or not self._follows(board, 1 - player):
+            if self.positions:
+                self.clear_tables()
+            self.positions.clear()
+        self.positions.push(position)
+
+    def load_positions(self, keys):
+        """ Replaces the game's positions, for a player that moves in several games.
 
-        if self.my_piece == self.pieces[0]:
-            player = 0
-        else:
-            player = 1
-
-        if not drop_phase:
-            succ_for_drop = self.succ(state, player)
-            max_for_drop = float('-inf')
-            for s in succ_for_drop:
-                temp = self.max_value(s, 0, (player+1)%2)
-                if temp >= max_for_drop:
-                    max_for_drop = temp
-                    this_s = s
-            move = self.helper_move(state, this_s)
-
-            return move
-
-        # select an unoccupied space randomly
-        # TODO: implement a minimax algorithm to play better
-
-        succ_for_move = self.succ(state, player)
-        max_for_move = float('-inf')
-        for s in succ_for_move:
-            temp = self.max_value(s, 0, (player+1)%2)
-            if temp >= max_for_move:
-                max_for_move = temp
-                this_s = s
-        move = self.helper_move(state, this_s)
-
-        return move
+        Args:
+            keys (iterable): Board.key() of every position of the game so far,
+                the position to move from last
+        """
+        keys = list(keys)
+        if keys[:len(self.positions)] != self.positions.keys:
+            self.clear_tables()
+        self.positions = PositionHistory(keys)
+        self._last_bits = None
+
+    def clear_tables(self):
+        """ Empties the transposition tables, the root search processes' too.
+
+        Stored values may be repetition draws against the positions of the game
+        they were searched in, so they are dropped when the player goes on with
+        another game.
+        """
+        self.tt.clear()
+        if self._pool is not None:
+            self._pool.clear()
+
+    def _follows(self, board, opponent):
+        last = Board(*self._last_bits)
+        for m in last.moves(opponent):
+            last.apply(m, opponent)
+            if last.bits == board.bits:
+                return True
+            last.undo(m, opponent)
+        return False
+
+    def _select_move(self, board, player, time_limit):
+        # the first drops were searched offline much deeper than we can afford here
+        if self.book is not None and board.count(player) < 4 and side_to_move(board) == player:
+            move = self.book.lookup(board)
+            if move is not None:
+                return move, 'book'
+
+        # the movement phase is solved, look the move up instead of searching
+        if self.endgame is not None and board.count(0) == 4 and board.count(1) == 4:
+            move = self.endgame.best_move(board, player)
+            if move is not None:
+                return move, 'endgame'
+
+        if time_limit is None:
+            time_limit = self.time_limit
+        return self.iterative_deepening(board, player, time.perf_counter() + time_limit), 'search'
+
+    def iterative_deepening(self, board, player, deadline):
+        """ Runs alpha-beta searches of increasing depth until the deadline.
+
+        Args:
+            board (Board): the current position, left unchanged
+            player (int): index in self.pieces of this player, who is to move
+            deadline (float): time.perf_counter() value at which to stop searching
+
+        Returns:
+            Move: the best move of the deepest search that finished in time
+        """
+        start = time.perf_counter()
+        self.nodes = 0
+        self.depth_reached = 0
+        self._next_check = NODE_CHECK_INTERVAL
+        self._deadline = deadline
+        self._me = player
+        self.tt.new_search()
+        if self.workers > 1:
+            self.root_pool().new_search()
+        self._killers = []
+        for table in self.history:
+            for m in table:
+                table[m] >>= 1
+
+        game_length = len(self.positions)
+
+        # moves are played on the board in place and taken back after the search, so
+        # the search does not allocate a board per node. The same search covers the
+        # drop phase and continued gameplay since board.moves() knows the phase.
+        # The search board keeps its pattern sums up to date move by move.
+        board = IncrementalBoard(*board.bits)
+        root_moves = list(board.moves(player))
+        best_move = root_moves[0]
+        stats = self._stats
+        depth = 0
+        while self.max_depth is None or depth < self.max_depth:
+            depth += 1
+            iteration_start = time.perf_counter()
+            iteration_nodes = self.nodes
+            try:
+                value, move = self.search_root(board, player, root_moves, depth)
+            except SearchTimeout:
+                # the interrupted line is still on top of the game's positions
+                self.positions.truncate(game_length)
+                break
+            best_move = move
+            self.depth_reached = depth
+            if stats is not None:
+                stats.depths.append((depth, time.perf_counter() - iteration_start,
+                                     self.nodes - iteration_nodes))
+            # a decided game or a fully searched tree will not change with more depth
+            if value == 1 or value == -1 or not self._horizon:
+                break
+            # the next iteration costs several times this one, don't start what can't finish
+            elapsed = time.perf_counter() - start
+            if elapsed > (deadline - start) / 2:
+                break
+            # search the best move first next time, it gives the most cutoffs
+            root_moves.remove(move)
+            root_moves.insert(0, move)
+        return best_move
+
+    def search_root(self, board, player, root_moves, depth):
+        """ Alpha-beta search of the root moves to the given depth.
+
+        Returns:
+            tuple: (value, move) of the best root move, the first one on ties
+        """
+        self.reserve_killers(depth)
+        if self.workers > 1:
+            value, move, self._horizon, nodes = self.root_pool().search_root(
+                self, board, player, root_moves, depth)
+            self.nodes += nodes
+            return value, move
+
+        self._depth_limit = depth
+        self._horizon = False
+        alpha = float('-inf')
+        best_move = None
+        for m in root_moves:
+            board.apply(m, player)
+            try:
+                temp = self.max_value(board, 1, (player+1)%2, alpha, float('inf'))
+            finally:
+                board.undo(m, player)
+            if temp > alpha:
+                alpha = temp
+                best_move = m
+        if best_move is None:
+            # every move scored -inf, which only happens if the opponent can't move
+            best_move = root_moves[0]
+        return alpha, best_move
+
+    def reserve_killers(self, depth):
+        """ Makes room for the killer moves of every ply of a search to the given depth. """
+        while len(self._killers) < depth:
+            self._killers.append([None, None])
+
+    def order_moves(self, board, moves, player, depth):
+        """ Sorts the moves of a node, the most promising first.
+
+        Args:
+            board (Board): the node
+            moves (list): the legal moves of player at the node, sorted in place
+            player (int): index in self.pieces of the player to move
+            depth (int): the number of plies between the root and the node
+        """
+        threats = board.threats()
+        wins = threats[player]
+        blocks = threats[1 - player]
+        killers = self._killers[depth]
+        history = self.history[player]
+        scores = {}
+        for m in moves:
+            score = history.get(m, 0)
+            dst = 1 << m.dst
+            if dst & wins:
+                score += WIN_SCORE
+            elif dst & blocks:
+                score += BLOCK_SCORE
+            if m == killers[0]:
+                score += KILLER_SCORE + 1
+            elif m == killers[1]:
+                score += KILLER_SCORE
+            scores[m] = score
+        # the sort is stable, moves of equal score keep the generator's order
+        moves.sort(key=scores.__getitem__, reverse=True)
+
+    def record_cutoff(self, move, player, depth, draft):
+        """ Updates the killer moves and the history table after a cutoff. """
+        killers = self._killers[depth]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        history = self.history[player]
+        history[move] = history.get(move, 0) + draft * draft
+
+    def root_pool(self):
+        """ Returns the pool of root search processes, starting it on first use. """
+        if self._pool is None:
+            # parallel.py imports this module
+            from parallel import RootPool
+            self._pool = RootPool(self.workers, self._tt_bytes, self.batch_eval is not None,
+                                  self._value_net)
+        return self._pool
+
+    def close(self):
+        """ Stops the root search processes, if any were started. """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
 
     def opponent_move(self, move):
         """ Validates the opponent's next move against the internal board representation.
@@ -163,245 +492,205 @@ class Teeko2Player:
 
         Returns:
             int: 1 if this Teeko2Player wins, -1 if the opponent wins, 0 if no winner
-
-        TODO: complete checks for diagonal and 3x3 square corners wins
         """
-        # check horizontal wins
-        for row in state:
-            for i in range(2):
-                if row[i] != ' ' and row[i] == row[i+1] == row[i+2] == row[i+3]:
-                    return 1 if row[i] == self.my_piece else -1
-
-        # check vertical wins
-        for col in range(5):
-            for i in range(2):
-                if state[i][col] != ' ' and state[i][col] == state[i+1][col] == state[i+2][col] == state[i+3][col]:
-                    return 1 if state[i][col] == self.my_piece else -1
-
-        # check \ diagonal wins
-        for i in range(2):
-            for j in range(2):
-                if state[i][j] != ' ' and state[i][j] == state[i+1][j+1] == state[i+2][j+2] == state[i+3][j+3]:
-                    return 1 if state[i][j] == self.my_piece else -1
-
-        # check / diagonal wins
-        for i in range(3, 5):
-            for j in range(2):
-                if state[i][j] != ' ' and state[i][j] == state[i-1][j+1] == state[i-2][j+2] == state[i-3][j+3]:
-                    return 1 if state[i][j] == self.my_piece else -1
-
-        # check 3x3 square corners wins
-        for i in range(1, 4):
-            for j in range(1, 4):
-                if (state[i][j] == ' ' and
-                        state[i-1][j-1] != ' ' and
-                        state[i-1][j-1] == state[i-1][j+1] == state[i+1][j-1] == state[i+1][j+1]):
-                    return 1 if state[i-1][j-1] == self.my_piece else -1
-
-        return 0 # no winner yet
+        winner = Board.from_state(state).winner()
+        if winner is None:
+            return 0 # no winner yet
+        return 1 if self.pieces[winner] == self.my_piece else -1
 
     def succ(self, state, player):
-        player_piece = self.pieces[player]
-        opp_piece = self.pieces[(player+1)%2]
+        """ Returns the list of legal successors of a state.
+
+        This is the list-of-lists counterpart of Board.moves(); the search itself plays
+        moves in place on a Board instead of building successor states.
+
+        Args:
+            state (list of lists): the state to expand
+            player (int): index in self.pieces of the player to move
+
+        Returns:
+            list: one new state (list of lists) per legal move
+        """
+        board = Board.from_state(state)
         successors = []
-        player_locations = []
-        opp_locations = []
-        empty_locations = []
-        # record all pieces and empty spots of the current state
-        for i in range(5):
-            for j in range(5):
-                if state[i][j] == player_piece:
-                    player_locations.append((i, j))
-                elif state[i][j] == opp_piece:
-                    opp_locations.append((i, j))
-                elif state[i][j] == ' ':
-                    empty_locations.append((i, j))
-
-        #  if it is during the drop phase, add a new piece of the current player's type to the board
-        if len(player_locations) < 4:
-            for loc in empty_locations:
-                new_state = copy.deepcopy(state)
-                new_state[loc[0]][loc[1]] = player_piece
-                successors.append(new_state)
-            return successors
-
-        # if it is during continued gameplay, this means moving any one of the current player's
-        # pieces to an unoccupied location on the board
-        for p_loc in player_locations:
-            if p_loc[0] - 1 >= 0 and (p_loc[0] - 1, p_loc[1]) in empty_locations:
-                new_state = copy.deepcopy(state)
-                new_state[p_loc[0]][p_loc[1]] = ' '
-                new_state[p_loc[0] - 1][p_loc[1]] = player_piece
-                successors.append(new_state)
-            if p_loc[0] + 1 <= 4 and (p_loc[0] + 1, p_loc[1]) in empty_locations:
-                new_state = copy.deepcopy(state)
-                new_state[p_loc[0]][p_loc[1]] = ' '
-                new_state[p_loc[0] + 1][p_loc[1]] = player_piece
-                successors.append(new_state)
-            if p_loc[1] - 1 >= 0 and (p_loc[0], p_loc[1] - 1) in empty_locations:
-                new_state = copy.deepcopy(state)
-                new_state[p_loc[0]][p_loc[1]] = ' '
-                new_state[p_loc[0]][p_loc[1] - 1] = player_piece
-                successors.append(new_state)
-            if p_loc[1] + 1 <= 4 and (p_loc[0], p_loc[1] + 1) in empty_locations:
-                new_state = copy.deepcopy(state)
-                new_state[p_loc[0]][p_loc[1]] = ' '
-                new_state[p_loc[0]][p_loc[1] + 1] = player_piece
-                successors.append(new_state)
-            if p_loc[0] - 1 >= 0 and p_loc[1] - 1 >= 0 and (p_loc[0] - 1, p_loc[1] - 1) in empty_locations:
-                new_state = copy.deepcopy(state)
-                new_state[p_loc[0]][p_loc[1]] = ' '
-                new_state[p_loc[0] - 1][p_loc[1] - 1] = player_piece
-                successors.append(new_state)
-            if p_loc[0] - 1 >= 0 and p_loc[1] + 1 <= 4 and (p_loc[0] - 1, p_loc[1] + 1) in empty_locations:
-                new_state = copy.deepcopy(state)
-                new_state[p_loc[0]][p_loc[1]] = ' '
-                new_state[p_loc[0] - 1][p_loc[1] + 1] = player_piece
-                successors.append(new_state)
-            if p_loc[0] + 1 <= 4 and p_loc[1] + 1 <= 4 and (p_loc[0] + 1, p_loc[1] + 1) in empty_locations:
-                new_state = copy.deepcopy(state)
-                new_state[p_loc[0]][p_loc[1]] = ' '
-                new_state[p_loc[0] + 1][p_loc[1] + 1] = player_piece
-                successors.append(new_state)
-            if p_loc[0] + 1 <= 4 and p_loc[1] - 1 >= 0 and (p_loc[0] + 1, p_loc[1] - 1) in empty_locations:
-                new_state = copy.deepcopy(state)
-                new_state[p_loc[0]][p_loc[1]] = ' '
-                new_state[p_loc[0] + 1][p_loc[1] - 1] = player_piece
-                successors.append(new_state)
+        for m in board.moves(player):
+            board.apply(m, player)
+            successors.append(board.to_state())
+            board.undo(m, player)
         return successors
 
     def heuristic_game_value(self, state):
-        # determine whether the state is a terminal state before evaluating it heuristically
-        if self.game_value(state) != 0:
-            return self.game_value(state)
-
-        # if not terminal state, then evaluating heuristically
-        player_piece = self.my_piece
-        opp_piece = self.opp
-        player_locations = []
-        opp_locations = []
-        empty_locations = []
-        sum_player = 0
-        sum_opp = 0
-
-        # record all pieces of the current state
-        for i in range(5):
-            for j in range(5):
-                if state[i][j] == player_piece:
-                    player_locations.append((i, j))
-                elif state[i][j] == opp_piece:
-                    opp_locations.append((i, j))
-                elif state[i][j] == ' ':
-                    empty_locations.append((i, j))
-
-        # check horizontal wins
-        for i in range(5):
-            for j in range(2):
-                win_loc = [(i, j), (i, j + 1), (i, j + 2), (i, j + 3)]
-                summary = self.helper_heuristic_game_value(win_loc, player_locations, opp_locations, empty_locations)
-                sum_player += summary[0]
-                sum_opp += summary[1]
-
-        # check vertical wins
-        for j in range(5):
-            for i in range(2):
-                win_loc = [(i, j), (i + 1, j), (i + 2, j), (i + 3, j)]
-                summary = self.helper_heuristic_game_value(win_loc, player_locations, opp_locations, empty_locations)
-                sum_player += summary[0]
-                sum_opp += summary[1]
-
-        # check \ diagonal wins
-        for i in range(2):
-            for j in range(2):
-                win_loc = [(i, j), (i + 1, j + 1), (i + 2, j + 2), (i + 3, j + 3)]
-                summary = self.helper_heuristic_game_value(win_loc, player_locations, opp_locations, empty_locations)
-                sum_player += summary[0]
-                sum_opp += summary[1]
-
-        # check / diagonal wins
-        for i in range(3, 5):
-            for j in range(2):
-                win_loc = [(i, j), (i - 1, j + 1), (i - 2, j + 2), (i - 3, j + 3)]
-                summary = self.helper_heuristic_game_value(win_loc, player_locations, opp_locations, empty_locations)
-                sum_player += summary[0]
-                sum_opp += summary[1]
-
-        # check 3x3 square corners wins
-        for i in range(1, 4):
-            for j in range(1, 4):
-                win_loc = [(i - 1, j - 1), (i + 1, j - 1), (i - 1, j + 1), (i + 1, j + 1)]
-                summary = self.helper_heuristic_game_value(win_loc, player_locations, opp_locations, empty_locations)
-                if state[i][j] == ' ':
-                    sum_player += summary[0]
-                    sum_opp += summary[1]
-
-        if sum_player + sum_opp == 0:
-            return 0.0
+        """ Scores a state from this player's point of view.
+
+        Terminal states score 1 or -1. Otherwise every open pattern (four in a row or
+        3x3 corners with an empty center, not blocked by the other color) holding 2
+        pieces counts 1 and holding 3 pieces counts 3, and the value is
+        (2 / (sum_player + sum_opp + 1)) * sum_player - 1. See Board.evaluate().
+        """
+        return Board.from_state(state).evaluate(self.pieces.index(self.my_piece))
+
+    def max_value(self, board, depth, player, alpha=float('-inf'), beta=float('inf')):
+        """ Alpha-beta minimax value of a board, from this player's point of view.
+
+        Args:
+            board (Board): the position to evaluate; moves are applied and undone
+                in place, so it is unchanged when this method returns
+            depth (int): the number of plies between the root and this node
+            player (int): index in self.pieces of the player to move
+            alpha (float): value this player is already guaranteed elsewhere
+            beta (float): value the opponent is already guaranteed elsewhere
+
+        Raises:
+            SearchTimeout: when the deadline of the current move has passed
+        """
+        self.nodes += 1
+        if self.nodes >= self._next_check:
+            self._next_check = self.nodes + NODE_CHECK_INTERVAL
+            if time.perf_counter() >= self._deadline:
+                raise SearchTimeout()
+        # None unless this move is instrumented, so the counters cost one test each
+        stats = self._stats
+
+        # going back to a position of the game or of the line searched is a draw
+        # under the repetition rule, and searching on would only go round in circles
+        position = board.key(player)
+        if position in self.positions:
+            return 0
+
+        if depth >= self._depth_limit:
+            self._horizon = True
+            if stats is not None:
+                stats.leaf_evals += 1
+            if self.batch_eval is not None:
+                # only the children of the root get here, in the depth 1 iteration;
+                # they are scored like every other leaf, as a batch of one
+                return float(self.batch_eval.evaluate_bits(
+                    [board.bits[0]], [board.bits[1]], self._me, 1 - player)[0])
+            return board.evaluate(self._me)
+
+        winner = board.winner()
+        if winner is not None:
+            if stats is not None:
+                stats.terminal_hits += 1
+            return 1 if winner == self._me else -1
+
+        # positions reached through different move orders, or symmetric to one
+        # already searched, are searched only once. Stored moves are in the
+        # orientation of the canonical image sym of the board.
+        key, sym = board.canonical_key(player)
+        draft = self._depth_limit - depth
+        moves = list(board.moves(player))
+        if draft > 1:
+            self.order_moves(board, moves, player, depth)
+        entry = self.tt.probe(key)
+        if stats is not None:
+            stats.tt_probes += 1
+            stats.tt_hits += entry is not None
+        if entry is not None:
+            if entry[1] >= draft:
+                value = entry[2]
+                bound = entry[3]
+                if (bound == EXACT or (bound == LOWER and value >= beta)
+                        or (bound == UPPER and value <= alpha)):
+                    # the stored subtree may have stopped at a horizon
+                    self._horizon = True
+                    if stats is not None:
+                        stats.tt_cutoffs += 1
+                    return value
+            # search the stored best move first
+            tt_move = transform_move(entry[4], INVERSE[sym])
+            if tt_move in moves:
+                moves.remove(tt_move)
+                moves.insert(0, tt_move)
+
+        if draft == 1 and self.batch_eval is not None and moves:
+            value, best_move = self.evaluate_children(board, moves, player)
+            if stats is not None:
+                stats.leaf_evals += len(moves)
+            self.tt.store(key, draft, value, EXACT, transform_move(best_move, sym))
+            return value
+
+        # stored values of positions below may be repetition draws of this line;
+        # like most engines, the table accepts that within a game, and
+        # clear_tables() drops them when the player goes on with another
+        self.positions.push(position)
+        alpha_orig = alpha
+        beta_orig = beta
+        best_move = None
+        if player == self._me:
+            value = float('-inf')
+            for m in moves:
+                board.apply(m, player)
+                temp = self.max_value(board, depth+1, (player+1)%2, alpha, beta)
+                board.undo(m, player)
+                if temp > value:
+                    value = temp
+                    best_move = m
+                    if value > alpha:
+                        alpha = value
+                        if alpha >= beta:
+                            self.record_cutoff(m, player, depth, draft)
+                            if stats is not None:
+                                stats.cutoffs += 1
+                            break
+        else:
+            value = float('inf')
+            for m in moves:
+                board.apply(m, player)
+                temp = self.max_value(board, depth+1, (player+1)%2, alpha, beta)
+                board.undo(m, player)
+                if temp < value:
+                    value = temp
+                    best_move = m
+                    if value < beta:
+                        beta = value
+                        if alpha >= beta:
+                            self.record_cutoff(m, player, depth, draft)
+                            if stats is not None:
+                                stats.cutoffs += 1
+                            break
+        self.positions.pop()
+
+        if value <= alpha_orig:
+            bound = UPPER
+        elif value >= beta_orig:
+            bound = LOWER
         else:
-            return (2.0 / (sum_player + sum_opp + 1)) * sum_player - 1
-
-    def helper_heuristic_game_value(self, win_loc, player_locations, opp_locations, empty_locations):
-        sum_player = 0
-        sum_opp = 0
-        player_occupy = list(set. intersection(set(player_locations), set(win_loc)))
-        opp_occupy = list(set. intersection(set(opp_locations), set(win_loc)))
-        if len(player_occupy) == 2:
-            remain_for_player = list(set(win_loc) - set(player_occupy))
-            if set(remain_for_player).issubset(set(empty_locations)):
-                sum_player = 1
-
-        if len(player_occupy) == 3:
-            remain_for_player = list(set(win_loc) - set(player_occupy))
-            if set(remain_for_player).issubset(set(empty_locations)):
-                sum_player = 3
-
-        if len(opp_occupy) == 2:
-            remain_for_opp = list(set(win_loc) - set(opp_occupy))
-            if set(remain_for_opp).issubset(set(empty_locations)):
-                sum_opp = 1
-
-        if len(opp_occupy) == 3:
-            remain_for_opp = list(set(win_loc) - set(opp_occupy))
-            if set(remain_for_opp).issubset(set(empty_locations)):
-                sum_opp = 3
-
-        return (sum_player, sum_opp)
-
-    def max_value(self, state, depth, player):
-        # the actual depth is 2, since I compute the successors before I call this function on each successor
-        bound = 1
-        if self.game_value(state) == 1:
-            return 1
-        elif self.game_value(state) == -1:
-            return -1
-
-        successors = self.succ(state, player)
-        if depth == bound:
-            return self.heuristic_game_value(state)
-        elif self.my_piece == self.pieces[player]:
-            max_value = float('-inf')
-            for s in successors:
-                temp = self.max_value(s, depth+1, (player+1)%2)
-                if temp >= max_value:
-                    max_value = temp
-            return max_value
+            bound = EXACT
+        self.tt.store(key, draft, value, bound, transform_move(best_move, sym))
+        return value
+
+    def evaluate_children(self, board, moves, player):
+        """ Scores every child of a node just above the horizon in one batched call.
+
+        Args:
+            board (Board): the node, left unchanged
+            moves (list): the legal moves of player at the node
+            player (int): index in self.pieces of the player to move
+
+        Returns:
+            tuple: (value, move) of the best child for the player to move, the
+                first one on ties
+        """
+        np = self.batch_eval.np
+        self.nodes += len(moves)
+        self._horizon = True
+        masks = np.array([m.mask for m in moves], dtype=np.int64)
+        black = np.full(len(moves), board.bits[0], dtype=np.int64)
+        red = np.full(len(moves), board.bits[1], dtype=np.int64)
+        if player == 0:
+            black ^= masks
         else:
-            min_value = float('inf')
-            for s in successors:
-                temp = self.max_value(s, depth+1, (player+1)%2)
-                if temp <= min_value:
-                    min_value = temp
-            return min_value
-
-    def helper_move(self, origin_state, new_state):
-        move = []
-        for i in range(5):
-            for j in range(5):
-                if origin_state[i][j] == self.my_piece and new_state[i][j] == ' ':
-                    move.append((i, j))
-                if origin_state[i][j] == ' ' and new_state[i][j] == self.my_piece:
-                    move.insert(0, (i, j))
-        return move
+            red ^= masks
+        values = self.batch_eval.evaluate_bits(black, red, self._me, player)
+        # children repeating a position of the game or of the line are draws
+        h = board.hash
+        side = SIDE_KEYS[1 - player]
+        for i, m in enumerate(moves):
+            if ((h ^ m.keys[player]) & HASH_MASK) ^ side in self.positions:
+                values[i] = 0.0
+        i = int(values.argmax() if player == self._me else values.argmin())
+        return float(values[i]), moves[i]
 
 ############################################################################
 #
@@ -443,7 +732,11 @@ def main():
         turn %= 2
 
     # move phase - can't have a winner until all 8 pieces are on the board
-    while ai.game_value(ai.board) == 0:
+    rule = DrawRule()
+    history = PositionHistory([Board.from_state(ai.board).key(turn)])
+    plies = 0
+    draw = None
+    while ai.game_value(ai.board) == 0 and draw is None:
 
         # get the player or AI's move
         if ai.my_piece == ai.pieces[turn]:
@@ -473,9 +766,14 @@ def main():
         # update the game variables
         turn += 1
         turn %= 2
+        plies += 1
+        history.push(Board.from_state(ai.board).key(turn))
+        draw = rule.check(history, plies)
 
     ai.print_board()
-    if ai.game_value(ai.board) == 1:
+    if draw is not None:
+        print("Draw by repetition! Game over.")
+    elif ai.game_value(ai.board) == 1:
         print("AI wins! Game over.")
     else:
         print("You win! Game over.")
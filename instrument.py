@@ -0,0 +1,113 @@
+""" Search instrumentation for Teeko2Player.
+
+A SearchStats object collects the counters and timers of one move. The search
+only fills one in when instrumentation is on, either for a single move through
+Teeko2Player.make_move_with_stats() or for every move by giving the player a
+sink; otherwise the search hot path skips all of it. Finished stats are handed
+to the sink, which can keep them in memory, append them to a JSONL file or log
+them.
+"""
+
+import json
+import logging
+import time
+
+
+class SearchStats:
+    """ Counters and timers of the computation of one move.
+
+    Attributes:
+        source (str): where the move came from: 'search', 'book' or 'endgame'
+        move (list): the chosen move, in make_move()'s format
+        elapsed (float): seconds spent in make_move()
+        nodes (int): positions visited by the search, including parallel workers
+        leaf_evals (int): positions scored with the heuristic at the depth limit
+        terminal_hits (int): won or lost positions met inside the tree
+        cutoffs (int): alpha-beta cutoffs
+        tt_probes (int): transposition table lookups
+        tt_hits (int): lookups that found their position
+        tt_cutoffs (int): nodes answered from the transposition table
+        depths (list): one (depth, seconds, nodes) tuple per finished iteration
+        depth_reached (int): the deepest finished iteration
+    """
+
+    def __init__(self):
+        self.source = 'search'
+        self.move = None
+        self.elapsed = 0.0
+        self.nodes = 0
+        self.leaf_evals = 0
+        self.terminal_hits = 0
+        self.cutoffs = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.tt_cutoffs = 0
+        self.depths = []
+        self.depth_reached = 0
+        self._start = time.perf_counter()
+
+    def finish(self, move, nodes, depth_reached):
+        """ Records the outcome of the move. """
+        self.elapsed = time.perf_counter() - self._start
+        self.move = move
+        self.nodes = nodes
+        self.depth_reached = depth_reached
+
+    @property
+    def nodes_per_second(self):
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+    def to_dict(self):
+        """ Returns the stats as a JSON-serializable dict. """
+        return {
+            'source': self.source,
+            'move': [list(square) for square in self.move] if self.move else None,
+            'elapsed': self.elapsed,
+            'nodes': self.nodes,
+            'nodes_per_second': self.nodes_per_second,
+            'leaf_evals': self.leaf_evals,
+            'terminal_hits': self.terminal_hits,
+            'cutoffs': self.cutoffs,
+            'tt_probes': self.tt_probes,
+            'tt_hits': self.tt_hits,
+            'tt_cutoffs': self.tt_cutoffs,
+            'depths': [list(depth) for depth in self.depths],
+            'depth_reached': self.depth_reached,
+        }
+
+    def __repr__(self):
+        return 'SearchStats(%s)' % json.dumps(self.to_dict())
+
+
+class MemorySink:
+    """ Keeps the stats of every move in a list. """
+
+    def __init__(self):
+        self.records = []
+
+    def emit(self, stats):
+        self.records.append(stats)
+
+
+class JsonlSink:
+    """ Appends the stats of every move to a JSONL file. """
+
+    def __init__(self, path):
+        self.path = path
+
+    def emit(self, stats):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(stats.to_dict()) + '\n')
+
+
+class LoggingSink:
+    """ Logs the stats of every move. """
+
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger('teeko2.search')
+        self.level = level
+
+    def emit(self, stats):
+        self.logger.log(self.level, 'move %s from %s in %.3fs: %d nodes, depth %d, %d cutoffs, tt hits %d/%d',
+                        stats.move, stats.source, stats.elapsed, stats.nodes, stats.depth_reached,
+                        stats.cutoffs, stats.tt_hits, stats.tt_probes)
@@ -0,0 +1,196 @@
+""" Load test client for server.py.
+
+Plays many games against a running server at once, over a few connections, as
+a stand-in for real clients: the client side of every game plays random legal
+moves. Busy replies are retried after a short pause. The report gives the
+results of the games, the throughput, the latency percentiles of the move
+requests and the number of busy, timed out and failed requests.
+
+    python server.py --port 7744 &
+    python loadtest.py --port 7744 --games 1000 --connections 8 --time-limit 0.05
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+
+from arena import percentile
+from bitboard import PIECES, Board, Move
+from server import DEFAULT_PORT
+
+# seconds to wait before sending a request the server refused as busy again
+BUSY_PAUSE = 0.05
+
+
+class Connection:
+    """ A connection to the server multiplexing the requests of many games. """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.waiting = {}
+        self._ids = itertools.count(1)
+        self._receiver = asyncio.ensure_future(self._receive())
+
+    @classmethod
+    async def open(cls, host, port):
+        reader, writer = await asyncio.open_connection(host, port, limit=1 << 20)
+        return cls(reader, writer)
+
+    async def _receive(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                reply = json.loads(line)
+                future = self.waiting.pop(reply.get('id'), None)
+                if future is not None and not future.done():
+                    future.set_result(reply)
+        finally:
+            for future in self.waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionError('connection closed'))
+
+    async def request(self, request):
+        """ Sends a request and returns the server's reply. """
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[request_id] = future
+        self.writer.write((json.dumps(dict(request, id=request_id)) + '\n').encode())
+        await self.writer.drain()
+        return await future
+
+    async def close(self):
+        self.writer.close()
+        self._receiver.cancel()
+
+
+async def play(connection, rng, stats, config, time_limit, max_plies):
+    """ Plays one game against the server with random moves. """
+    reply = await connection.request({'op': 'new', 'config': config})
+    if not reply['ok']:
+        stats['errors'] += 1
+        return
+    game = reply['game']
+    me = 1 - PIECES.index(reply['piece'])
+    board = Board()
+    turn = 0
+    plies = 0
+    try:
+        while plies < max_plies:
+            move = None
+            if turn == me:
+                move = rng.choice(list(board.moves(me))).to_list()
+            start = time.perf_counter()
+            reply = await connection.request({'op': 'move', 'game': game, 'move': move,
+                                              'time_limit': time_limit})
+            if not reply['ok']:
+                if reply['error'] == 'busy':
+                    stats['busy'] += 1
+                    await asyncio.sleep(BUSY_PAUSE)
+                    continue
+                if reply['error'] == 'timeout':
+                    # our move was played, ask for the server's reply alone
+                    stats['timeouts'] += 1
+                    if move is not None:
+                        board.apply(Move.from_list(move), turn)
+                        turn = 1 - turn
+                        plies += 1
+                    continue
+                stats['errors'] += 1
+                return
+            stats['latency'].append(time.perf_counter() - start)
+            if move is not None:
+                board.apply(Move.from_list(move), turn)
+                turn = 1 - turn
+                plies += 1
+            if reply['move'] is not None:
+                board.apply(Move.from_list(reply['move']), turn)
+                turn = 1 - turn
+                plies += 1
+            if reply['winner'] is not None:
+                stats['wins' if reply['winner'] == PIECES[me] else 'losses'] += 1
+                break
+            if reply.get('draw') is not None:
+                stats['draws'] += 1
+                break
+        stats['games'] += 1
+    finally:
+        await connection.request({'op': 'close', 'game': game})
+
+
+async def run(host, port, games, connections=4, concurrency=None, config=None, time_limit=0.05,
+              max_plies=40, seed=0):
+    """ Plays games against the server.
+
+    Args:
+        host (str): server address
+        port (int): server port
+        games (int): number of games to play
+        connections (int): number of connections the games are spread over
+        concurrency (int): games in progress at once, defaults to all of them
+        config (dict): Teeko2Player options of the server's player
+        time_limit (float): seconds of search the server is asked for per move
+        max_plies (int): plies after which a game is given up
+        seed (int): seed of the client's random moves
+
+    Returns:
+        dict: the load test report
+    """
+    rng = random.Random(seed)
+    stats = {'games': 0, 'wins': 0, 'losses': 0, 'draws': 0, 'busy': 0, 'timeouts': 0, 'errors': 0, 'latency': []}
+    pool = [await Connection.open(host, port) for i in range(connections)]
+    limit = asyncio.Semaphore(concurrency or games)
+
+    async def one(i):
+        async with limit:
+            await play(pool[i % connections], random.Random(rng.random()), stats, config or {},
+                       time_limit, max_plies)
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(one(i) for i in range(games)))
+    finally:
+        for connection in pool:
+            await connection.close()
+    elapsed = time.perf_counter() - start
+
+    latency = stats.pop('latency')
+    stats.update({
+        'seconds': elapsed,
+        'requests_per_second': len(latency) / elapsed if elapsed else None,
+        'latency': {
+            'requests': len(latency),
+            'p50': percentile(latency, 50),
+            'p90': percentile(latency, 90),
+            'p99': percentile(latency, 99),
+            'max': max(latency) if latency else None,
+        },
+    })
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test a Teeko2 game server.')
+    parser.add_argument('--host', default='127.0.0.1', help='server address')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='server port')
+    parser.add_argument('--games', type=int, default=100, help='number of games')
+    parser.add_argument('--connections', type=int, default=4, help='number of connections')
+    parser.add_argument('--concurrency', type=int, default=None, help='games in progress at once')
+    parser.add_argument('--config', default='{}', help="JSON Teeko2Player options of the server's player")
+    parser.add_argument('--time-limit', type=float, default=0.05, help='seconds of search per server move')
+    parser.add_argument('--max-plies', type=int, default=40, help='plies after which a game is given up')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random moves')
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args.host, args.port, args.games, args.connections, args.concurrency,
+                             json.loads(args.config), args.time_limit, args.max_plies, args.seed))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+""" Root-parallel search for Teeko2Player.
+
+The root moves of every iterative deepening iteration are searched by a pool
+of worker processes, one root move per task. The workers share the best root
+value found so far as the alpha bound of their searches. Results are combined
+in root move order, not in completion order, and ties that a shared bound
+could hide are searched again, so the chosen move is the one a sequential
+search would choose whatever the scheduling.
+
+The pool is started by the first search of a player and lives until the
+player's close().
+"""
+
+import multiprocessing
+import time
+
+from bitboard import IncrementalBoard
+from game import NODE_CHECK_INTERVAL, SearchTimeout, Teeko2Player
+from repetition import PositionHistory
+
+# state of a worker process, set up by _init_worker
+_searcher = None
+_alpha = None
+_generation = None
+_epoch = 0
+
+
+def _init_worker(alpha, tt_bytes, batch_leaves, value_net):
+    global _searcher, _alpha
+    _alpha = alpha
+    _searcher = Teeko2Player(tt_bytes=tt_bytes, batch_leaves=batch_leaves, value_net=value_net,
+                             endgame_path=None, book_path=None)
+
+
+def _search_move(task):
+    """ Searches one root move in a worker.
+
+    Returns:
+        tuple: (value, alpha the search started with, whether it reached the
+            horizon, nodes searched), or None if the deadline passed
+    """
+    global _generation, _epoch
+    black, red, player, me, move, depth, deadline, generation, epoch, positions = task
+    searcher = _searcher
+    if me != searcher._me or epoch != _epoch:
+        _epoch = epoch
+        # stored values are from the point of view of the searching player
+        searcher.tt.clear()
+        searcher._me = me
+        searcher.my_piece = searcher.pieces[me]
+        searcher.opp = searcher.pieces[1 - me]
+    if generation != _generation:
+        _generation = generation
+        searcher.tt.new_search()
+    # the deadline is wall-clock time, perf_counter() values don't compare across processes
+    searcher._deadline = time.perf_counter() + (deadline - time.time())
+    searcher._depth_limit = depth
+    searcher._horizon = False
+    searcher.reserve_killers(depth)
+    # the game's positions, for repetitions
+    searcher.positions = PositionHistory(positions)
+    searcher.nodes = 0
+    searcher._next_check = NODE_CHECK_INTERVAL
+
+    board = IncrementalBoard(black, red)
+    board.apply(move, player)
+    alpha = _alpha.value
+    try:
+        value = searcher.max_value(board, 1, (player+1)%2, alpha, float('inf'))
+    except SearchTimeout:
+        return None
+    if value > alpha:
+        with _alpha.get_lock():
+            if value > _alpha.value:
+                _alpha.value = value
+    return value, alpha, searcher._horizon, searcher.nodes
+
+
+class RootPool:
+    """ A pool of worker processes searching root moves in parallel. """
+
+    def __init__(self, workers, tt_bytes, batch_leaves=False, value_net=None):
+        """ Starts the worker processes.
+
+        Args:
+            workers (int): number of processes
+            tt_bytes (int): transposition table memory cap of each worker
+            batch_leaves (bool): whether the workers batch leaf evaluation
+            value_net (str): weights file of the workers' value network, if any
+        """
+        self.alpha = multiprocessing.Value('d', float('-inf'))
+        self.generation = 0
+        self.epoch = 0
+        self.pool = multiprocessing.Pool(workers, _init_worker,
+                                         (self.alpha, tt_bytes, batch_leaves, value_net))
+
+    def new_search(self):
+        """ Marks the start of a new move, see TranspositionTable.new_search(). """
+        self.generation += 1
+
+    def clear(self):
+        """ Makes the workers empty their transposition tables before their next search. """
+        self.epoch += 1
+
+    def search_root(self, searcher, board, player, root_moves, depth):
+        """ Parallel counterpart of Teeko2Player.search_root().
+
+        Args:
+            searcher (Teeko2Player): the player searching, used for its deadline and
+                point of view, and to search ties again
+            board (Board): the position, left unchanged
+            player (int): index in Teeko2Player.pieces of the player to move
+            root_moves (list): the moves to search, in order of preference
+            depth (int): the search depth
+
+        Returns:
+            tuple: (value, move, horizon, nodes) where horizon tells whether any
+                search stopped at the depth limit
+
+        Raises:
+            SearchTimeout: if the deadline passed before every root move was searched
+        """
+        with self.alpha.get_lock():
+            self.alpha.value = float('-inf')
+        deadline = time.time() + (searcher._deadline - time.perf_counter())
+        positions = tuple(searcher.positions.keys)
+        tasks = [(board.bits[0], board.bits[1], player, searcher._me, m, depth, deadline, self.generation, self.epoch,
+                  positions) for m in root_moves]
+        results = self.pool.map(_search_move, tasks, chunksize=1)
+        if None in results:
+            raise SearchTimeout()
+
+        nodes = sum(result[3] for result in results)
+        horizon = any(result[2] for result in results)
+        best_value = float('-inf')
+        best = None
+        for i, (value, alpha, _, _) in enumerate(results):
+            # a value at or below the alpha a search started with is only an upper bound
+            if value > alpha and value > best_value:
+                best_value = value
+                best = i
+        if best is None:
+            # every move scored -inf, which only happens if the opponent can't move
+            return best_value, root_moves[0], horizon, nodes
+
+        # an earlier move whose bound reaches the best value may be just as good,
+        # and a sequential search would have picked it
+        for i in range(best):
+            value, alpha = results[i][0], results[i][1]
+            if value <= alpha and value >= best_value:
+                board.apply(root_moves[i], player)
+                try:
+                    searcher._depth_limit = depth
+                    value = searcher.max_value(board, 1, (player+1)%2)
+                finally:
+                    board.undo(root_moves[i], player)
+                if value >= best_value:
+                    best_value = value
+                    best = i
+                    break
+        return best_value, root_moves[best], horizon, nodes
+
+    def close(self):
+        """ Stops the worker processes. """
+        self.pool.terminate()
+        self.pool.join()
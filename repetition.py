@@ -0,0 +1,86 @@
+""" Position history and draw rules for the movement phase.
+
+Pieces only move around once all eight are down, so the same position can come
+back again and again. A PositionHistory is a stack of position keys
+(Board.key(), which includes the side to move) with a count per key: the game
+drivers push every position played, and the search pushes the positions of the
+line it is looking at on top of the game's and pops them on the way back, so a
+position repeating anything below it is found with one lookup.
+
+A DrawRule decides when a game driver stops a game as a draw.
+"""
+
+DEFAULT_REPETITIONS = 3
+
+
+class PositionHistory:
+    """ A stack of position keys with the number of times each key is on it. """
+
+    def __init__(self, keys=()):
+        self.keys = []
+        self.counts = {}
+        for key in keys:
+            self.push(key)
+
+    def push(self, key):
+        self.keys.append(key)
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def pop(self):
+        key = self.keys.pop()
+        n = self.counts[key] - 1
+        if n:
+            self.counts[key] = n
+        else:
+            del self.counts[key]
+        return key
+
+    def truncate(self, length):
+        """ Pops keys until length are left. """
+        while len(self.keys) > length:
+            self.pop()
+
+    def count(self, key):
+        """ Returns how many times a key is on the stack. """
+        return self.counts.get(key, 0)
+
+    def clear(self):
+        self.keys = []
+        self.counts = {}
+
+    def __contains__(self, key):
+        return key in self.counts
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class DrawRule:
+    """ Ends a game as a draw on repeated positions or after too many plies. """
+
+    def __init__(self, repetitions=DEFAULT_REPETITIONS, max_plies=None):
+        """
+        Args:
+            repetitions (int): the game is a draw once a position has occurred this
+                many times; None or 0 disables the rule
+            max_plies (int): the game is a draw after this many plies; None
+                disables the rule
+        """
+        self.repetitions = repetitions
+        self.max_plies = max_plies
+
+    def check(self, history, plies):
+        """ Checks a game for a draw after its last move.
+
+        Args:
+            history (PositionHistory): the positions of the game, the last one on top
+            plies (int): number of moves played
+
+        Returns:
+            str: 'repetition' or 'max_plies' if the game is a draw, else None
+        """
+        if self.repetitions and history.keys and history.count(history.keys[-1]) >= self.repetitions:
+            return 'repetition'
+        if self.max_plies is not None and plies >= self.max_plies:
+            return 'max_plies'
+        return None
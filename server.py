@@ -0,0 +1,431 @@
+""" Asynchronous Teeko2 game server.
+
+Clients connect over TCP and exchange JSON objects, one per line. Every request
+may carry an "id", echoed in its reply, so that one connection can drive many
+games at once; replies to concurrent requests may come out of order.
+
+    {"op": "new", "piece": "b", "config": {"max_depth": 4}}
+        -> {"ok": true, "game": "g1", "piece": "b"}
+    {"op": "move", "game": "g1", "move": [[2, 2]], "time_limit": 0.5}
+        -> {"ok": true, "move": [[1, 1]], "winner": null, "draw": null}
+    {"op": "state", "game": "g1"}
+    {"op": "close", "game": "g1"}
+    {"op": "stats"}
+
+"piece" is the color of the server's player, black moves first. A "move"
+request plays the client's move, if any (omit it when the server's player
+moves first), then the server's reply move; "winner" is "b" or "r" once the
+game is won, and "draw" is "repetition" once a position has occurred
+--repetitions times, or "max_plies" after --max-plies plies. "config" may set
+the Teeko2Player options in CONFIG_KEYS.
+
+Sessions only hold the board and the keys of its positions, so the server can
+keep thousands of games. Searches run on a pool of worker processes, where each
+worker keeps one Teeko2Player per configuration and color across games, so
+their transposition tables stay warm; every search is sent the positions of its
+game, as the search avoids repeating them. At most --max-pending searches are
+queued or running; beyond that a move request is answered with the error
+"busy" right away, and can be sent again as is. A search that doesn't finish within its time limit plus
+DEADLINE_GRACE seconds is answered with "timeout"; the client's move is played
+by then, so the server's reply is asked for again with a move request without
+a move.
+
+    python server.py --port 7744 --workers 4
+    python loadtest.py --port 7744 --games 1000
+
+Failed requests are answered with {"ok": false, "error": "..."}.
+"""
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import itertools
+import json
+import os
+import random
+import signal
+import sys
+import time
+
+from bitboard import PIECES, Board, Move
+from repetition import DEFAULT_REPETITIONS, DrawRule, PositionHistory
+
+DEFAULT_PORT = 7744
+
+# Teeko2Player options a client may set for its game
+CONFIG_KEYS = ('time_limit', 'max_depth', 'batch_leaves')
+
+# largest max_depth a client may set
+MAX_DEPTH = 32
+
+# seconds a search may overrun its time limit before its request times out
+DEADLINE_GRACE = 1.0
+
+# longest line the server reads from a client
+MAX_LINE = 64 * 1024
+
+# players a worker keeps, each with a transposition table of its own; the least
+# recently used one is dropped beyond that
+MAX_PLAYERS = 8
+
+
+class RequestError(Exception):
+    """ A request the server can't serve; the message is sent to the client. """
+
+
+class GameSession:
+    """ The state of one game: a board, the server's color and whose turn it is. """
+
+    def __init__(self, game_id, me, config, rule=None):
+        self.game_id = game_id
+        self.me = me
+        self.config = config
+        self.rule = rule or DrawRule()
+        self.board = Board()
+        self.positions = PositionHistory([self.board.key(0)])
+        self.turn = 0
+        self.plies = 0
+        self.winner = None
+        self.draw = None
+        self.busy = False
+
+    @property
+    def over(self):
+        return self.winner is not None or self.draw is not None
+
+    def play(self, move):
+        """ Plays a move of the side to move after checking that it is legal.
+
+        Args:
+            move (list): a move in Teeko2Player's [(row, col), (source_row, source_col)] format
+
+        Raises:
+            RequestError: if the move is malformed or illegal
+        """
+        try:
+            m = Move.from_list([tuple(square) for square in move])
+        except (TypeError, ValueError, IndexError, KeyError):
+            raise RequestError('illegal move %s' % json.dumps(move))
+        if m not in set(self.board.moves(self.turn)):
+            raise RequestError('illegal move %s' % json.dumps(move))
+        self.board.apply(m, self.turn)
+        self.turn = 1 - self.turn
+        self.plies += 1
+        winner = self.board.winner()
+        if winner is not None:
+            self.winner = winner
+            return
+        self.positions.push(self.board.key(self.turn))
+        self.draw = self.rule.check(self.positions, self.plies)
+
+    def result(self):
+        """ Returns the "winner" and "draw" fields of a reply. """
+        return {'winner': None if self.winner is None else PIECES[self.winner], 'draw': self.draw}
+
+    def to_dict(self):
+        return {
+            'game': self.game_id,
+            'piece': PIECES[self.me],
+            'board': [''.join(row) for row in self.board.to_state()],
+            'turn': PIECES[self.turn],
+            'plies': self.plies,
+            'winner': None if self.winner is None else PIECES[self.winner],
+            'draw': self.draw,
+        }
+
+
+# state of a worker process: Teeko2Player by (configuration, color), least
+# recently used first, and their transposition table size
+_players = collections.OrderedDict()
+_tt_bytes = None
+
+
+def _init_worker(tt_bytes):
+    global _tt_bytes
+    _tt_bytes = tt_bytes
+    # building the move and symmetry tables takes a while, do it before the first request
+    import game
+
+
+def _ready():
+    return True
+
+
+def _search(config, piece, state, positions, time_limit, deadline):
+    """ Computes a move in a worker process.
+
+    Args:
+        config (str): JSON of the Teeko2Player options of the game but the time limit
+        piece (str): the color to move
+        state (list of lists): the board
+        positions (tuple): keys of the positions of the game, the board's last
+        time_limit (float): seconds of search
+        deadline (float): time.time() by which the reply is due
+
+    Returns:
+        list: the move, or None if the deadline passed while the search was queued
+    """
+    remaining = deadline - time.time() - DEADLINE_GRACE / 2
+    if remaining <= 0:
+        return None
+    key = (config, piece)
+    player = _players.get(key)
+    if player is None:
+        # imported here so that the server process doesn't load the tables
+        from game import Teeko2Player
+        options = dict(json.loads(config), tt_bytes=_tt_bytes)
+        player = _players[key] = Teeko2Player(piece=piece, **options)
+        if len(_players) > MAX_PLAYERS:
+            _players.popitem(last=False)[1].close()
+    else:
+        _players.move_to_end(key)
+    # the player moves in many games, the positions it remembers may be another's
+    player.load_positions(positions)
+    return player.make_move(state, min(time_limit, remaining))
+
+
+class Teeko2Server:
+    """ Serves the JSON-lines protocol described in the module docstring. """
+
+    def __init__(self, workers=None, max_pending=None, time_limit=1.0, max_time=5.0,
+                 max_games=10000, tt_bytes=16 * 1024 * 1024, repetitions=DEFAULT_REPETITIONS,
+                 max_plies=None):
+        """ Starts the worker processes.
+
+        Args:
+            workers (int): number of search processes, defaults to the number of CPUs
+            max_pending (int): searches queued or running before requests are
+                refused as busy, defaults to twice the number of workers
+            time_limit (float): seconds of search of a move request without one
+            max_time (float): largest time limit a request may ask for
+            max_games (int): number of games the server keeps at once
+            tt_bytes (int): transposition table memory cap of each worker player
+            repetitions (int): occurrences of a position that make a game a draw,
+                0 to play on
+            max_plies (int): plies after which a game is a draw, None for no limit
+        """
+        workers = workers or os.cpu_count() or 1
+        self.pool = concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker,
+                                                           initargs=(tt_bytes,))
+        # start every worker now, so that the first requests don't wait for them
+        for future in [self.pool.submit(_ready) for i in range(workers)]:
+            future.result()
+        self.max_pending = max_pending or 2 * workers
+        self.time_limit = time_limit
+        self.max_time = max_time
+        self.max_games = max_games
+        self.draw_rule = DrawRule(repetitions, max_plies)
+        self.sessions = {}
+        self.pending = 0
+        # failed counts every refused request, busy and timed out ones included
+        self.counts = {'requests': 0, 'searches': 0, 'busy': 0, 'timeouts': 0, 'failed': 0}
+        self._ids = itertools.count(1)
+
+    async def handle_connection(self, reader, writer):
+        """ Serves the requests of one client until it disconnects. """
+        lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                # requests are served concurrently, a slow search doesn't hold up the others
+                task = asyncio.ensure_future(self._serve(line, writer, lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+
+    async def _serve(self, line, writer, lock):
+        self.counts['requests'] += 1
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise RequestError('a request must be a JSON object')
+            request_id = request.get('id')
+            reply = await self.dispatch(request)
+            reply['ok'] = True
+        except (RequestError, ValueError, TypeError) as e:
+            self.counts['failed'] += 1
+            reply = {'ok': False, 'error': str(e)}
+        if request_id is not None:
+            reply['id'] = request_id
+        async with lock:
+            try:
+                writer.write((json.dumps(reply) + '\n').encode())
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+    async def dispatch(self, request):
+        """ Serves one request.
+
+        Returns:
+            dict: the reply, without "ok" and "id"
+
+        Raises:
+            RequestError: if the request can't be served
+        """
+        op = request.get('op')
+        if op == 'new':
+            return self.new_game(request.get('piece'), request.get('config') or {})
+        if op == 'move':
+            session = self._session(request)
+            return await self.move(session, request.get('move'), request.get('time_limit'))
+        if op == 'state':
+            return self._session(request).to_dict()
+        if op == 'close':
+            session = self._session(request)
+            del self.sessions[session.game_id]
+            return {'game': session.game_id}
+        if op == 'stats':
+            return dict(self.counts, games=len(self.sessions), pending=self.pending)
+        raise RequestError('unknown op %r' % (op,))
+
+    def _session(self, request):
+        session = self.sessions.get(request.get('game'))
+        if session is None:
+            raise RequestError('unknown game %r' % (request.get('game'),))
+        return session
+
+    def new_game(self, piece, config):
+        """ Opens a game where the server plays the given color, or a random one. """
+        if len(self.sessions) >= self.max_games:
+            raise RequestError('too many games')
+        if piece is None:
+            piece = random.choice(PIECES)
+        if piece not in ('b', 'r'):
+            raise RequestError('piece must be "b" or "r"')
+        self._check_config(config)
+        game_id = 'g%d' % next(self._ids)
+        self.sessions[game_id] = GameSession(game_id, PIECES.index(piece), config, self.draw_rule)
+        return {'game': game_id, 'piece': piece}
+
+    def _check_config(self, config):
+        # bad values would only fail in the worker, at every move of the game
+        if not isinstance(config, dict) or set(config) - set(CONFIG_KEYS):
+            raise RequestError('config may only set %s' % ', '.join(CONFIG_KEYS))
+        time_limit = config.get('time_limit')
+        if time_limit is not None and (isinstance(time_limit, bool) or
+                                       not isinstance(time_limit, (int, float)) or not time_limit > 0):
+            raise RequestError('time_limit must be a positive number')
+        max_depth = config.get('max_depth')
+        if max_depth is not None and (isinstance(max_depth, bool) or not isinstance(max_depth, int) or
+                                      not 1 <= max_depth <= MAX_DEPTH):
+            raise RequestError('max_depth must be an integer from 1 to %d' % MAX_DEPTH)
+        if not isinstance(config.get('batch_leaves', False), bool):
+            raise RequestError('batch_leaves must be true or false')
+
+    async def move(self, session, move, time_limit=None):
+        """ Plays the client's move, if any, then searches and plays the server's reply. """
+        if session.busy:
+            raise RequestError('busy: the game is already searching')
+        if session.over:
+            raise RequestError('the game is over')
+        # refused before the client's move is played, so the request can simply be sent again
+        if self.pending >= self.max_pending:
+            self.counts['busy'] += 1
+            raise RequestError('busy')
+        if move is not None:
+            if session.turn == session.me:
+                raise RequestError("it is the server's turn, send no move")
+            session.play(move)
+            if session.over:
+                return dict(session.result(), move=None)
+        elif session.turn != session.me:
+            raise RequestError("it is the client's turn")
+        if time_limit is None:
+            time_limit = session.config.get('time_limit', self.time_limit)
+        time_limit = min(float(time_limit), self.max_time)
+        reply = await self._search(session, time_limit)
+        session.play(reply)
+        return dict(session.result(), move=reply)
+
+    async def _search(self, session, time_limit):
+        loop = asyncio.get_running_loop()
+        deadline = time.time() + time_limit + DEADLINE_GRACE
+        # the time limit comes with every search, players differing only by it are the same
+        config = json.dumps({k: v for k, v in session.config.items() if k != 'time_limit'},
+                            sort_keys=True)
+        self.pending += 1
+        self.counts['searches'] += 1
+        session.busy = True
+        try:
+            future = self.pool.submit(_search, config, PIECES[session.me], session.board.to_state(),
+                                      tuple(session.positions.keys), time_limit, deadline)
+        except Exception:
+            self.pending -= 1
+            session.busy = False
+            raise
+        # the slot is taken until the worker is done, even after a timeout reply
+        future.add_done_callback(lambda f: loop.call_soon_threadsafe(self._search_done))
+        try:
+            move = await asyncio.wait_for(asyncio.wrap_future(future), deadline - time.time())
+        except asyncio.TimeoutError:
+            move = None
+        except Exception as e:
+            raise RequestError('search failed: %r' % e)
+        finally:
+            session.busy = False
+        if move is None:
+            self.counts['timeouts'] += 1
+            raise RequestError('timeout')
+        return move
+
+    def _search_done(self):
+        self.pending -= 1
+
+    def close(self):
+        """ Stops the worker processes. """
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def serve(host, port, server, log=None):
+    """ Runs the server until cancelled. """
+    log = log or (lambda message: None)
+    # a terminated server stops like an interrupted one, so that the workers are shut down
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    listener = await asyncio.start_server(server.handle_connection, host, port, limit=MAX_LINE)
+    log('listening on %s' % ', '.join(str(s.getsockname()) for s in listener.sockets))
+    async with listener:
+        await listener.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve Teeko2 games over TCP.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='port to listen on')
+    parser.add_argument('--workers', type=int, default=None, help='number of search processes')
+    parser.add_argument('--max-pending', type=int, default=None,
+                        help='searches queued or running before requests are refused')
+    parser.add_argument('--time-limit', type=float, default=1.0, help='default seconds of search per move')
+    parser.add_argument('--max-time', type=float, default=5.0, help='largest time limit a request may ask for')
+    parser.add_argument('--max-games', type=int, default=10000, help='number of games kept at once')
+    parser.add_argument('--tt-mb', type=int, default=16, help='transposition table MiB per worker player')
+    parser.add_argument('--repetitions', type=int, default=DEFAULT_REPETITIONS,
+                        help='occurrences of a position that make a draw, 0 to play on')
+    parser.add_argument('--max-plies', type=int, default=None, help='plies after which a game is a draw')
+    args = parser.parse_args(argv)
+
+    server = Teeko2Server(args.workers, args.max_pending, args.time_limit, args.max_time,
+                          args.max_games, args.tt_mb * 1024 * 1024, args.repetitions, args.max_plies)
+    try:
+        asyncio.run(serve(args.host, args.port, server, log=lambda message: print(message, file=sys.stderr)))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
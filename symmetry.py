@@ -0,0 +1,103 @@
+""" Symmetry canonicalization of Teeko2 positions.
+
+The 5x5 board and its win patterns are unchanged by the 8 rotations and
+reflections listed in bitboard.SYMMETRIES, so symmetric positions have the same
+value and corresponding best moves. A position is stored once, in its
+canonical form (the image with the smallest key), together with moves in the
+canonical orientation; transform_move() and transform_move_list() map them back
+to the orientation of the board actually being played.
+"""
+
+from bitboard import SIZE, SQUARES, SYMMETRIES, drop_move, step_move
+
+# INVERSE[t] is the index of the symmetry undoing SYMMETRIES[t]
+INVERSE = tuple(next(u for u in range(8)
+                     if all(SYMMETRIES[u][SYMMETRIES[t][sq]] == sq for sq in range(SQUARES)))
+                for t in range(8))
+
+# transform() looks up the low and the high bits of a bitboard in these tables
+_LOW_BITS = 13
+_LOW_MASK = (1 << _LOW_BITS) - 1
+
+
+def _chunk_table(perm, shift, size):
+    table = [0] * (1 << size)
+    for value in range(1 << size):
+        bits = 0
+        for i in range(size):
+            if value >> i & 1:
+                bits |= 1 << perm[i + shift]
+        table[value] = bits
+    return table
+
+
+_LOW_TABLES = tuple(_chunk_table(perm, 0, _LOW_BITS) for perm in SYMMETRIES)
+_HIGH_TABLES = tuple(_chunk_table(perm, _LOW_BITS, SQUARES - _LOW_BITS) for perm in SYMMETRIES)
+
+
+def transform(bits, t):
+    """ Returns the image of a bitboard under SYMMETRIES[t]. """
+    return _LOW_TABLES[t][bits & _LOW_MASK] | _HIGH_TABLES[t][bits >> _LOW_BITS]
+
+
+def canonical(black, red):
+    """ Returns the canonical form of a board.
+
+    Args:
+        black (int): bitboard of the black pieces
+        red (int): bitboard of the red pieces
+
+    Returns:
+        tuple: (key, t) where key = black' | red' << 25 is the smallest over the 8
+            images (black', red') of the board and t the index in SYMMETRIES of
+            the image it comes from
+    """
+    best = black | red << SQUARES
+    best_t = 0
+    for t in range(1, 8):
+        key = (_LOW_TABLES[t][black & _LOW_MASK] | _HIGH_TABLES[t][black >> _LOW_BITS]
+               | (_LOW_TABLES[t][red & _LOW_MASK] | _HIGH_TABLES[t][red >> _LOW_BITS]) << SQUARES)
+        if key < best:
+            best = key
+            best_t = t
+    return best, best_t
+
+
+def _move_maps():
+    maps = []
+    for perm in SYMMETRIES:
+        mapping = {}
+        for sq in range(SQUARES):
+            mapping[drop_move(sq)] = drop_move(perm[sq])
+        for src in range(SQUARES):
+            for dst in range(SQUARES):
+                try:
+                    move = step_move(src, dst)
+                except KeyError:
+                    continue
+                mapping[move] = step_move(perm[src], perm[dst])
+        maps.append(mapping)
+    return tuple(maps)
+
+
+_MOVE_MAPS = _move_maps()
+
+
+def transform_move(move, t):
+    """ Returns the image of a Move under SYMMETRIES[t]; None stays None. """
+    if move is None:
+        return None
+    return _MOVE_MAPS[t][move]
+
+
+def transform_move_list(move, t):
+    """ Returns the image of a move in Teeko2Player's [(row, col), (source_row, source_col)]
+    format under SYMMETRIES[t].
+
+    To map a move found on the canonical form (key, t) of a board back onto the
+    board, use INVERSE[t].
+    """
+    result = []
+    for row, col in move:
+        result.append(divmod(SYMMETRIES[t][row * SIZE + col], SIZE))
+    return result
@@ -0,0 +1,132 @@
+""" Memory-mapped access to precomputed Teeko2 table files.
+
+Solved positions and the opening book are large binary files that many
+short-lived player processes read. Instead of reading them into every process,
+MappedTable maps the file read-only: opening it only reads the header, lookups
+page in what they touch, and all processes share the same pages of the OS page
+cache.
+
+A table file is a fixed header followed by the payload:
+
+    magic       4s   b'T2TB'
+    version     H    FORMAT_VERSION
+    kind        4s   what the payload holds, e.g. b'EGDB' or b'BOOK'
+    variant     16s  RULES_VARIANT, the rules the table was computed for
+    length      Q    payload size in bytes
+    payload_crc I    CRC32 of the payload, checked by verify() only
+    header_crc  I    CRC32 of all the header fields above
+"""
+
+import mmap
+import os
+import struct
+import zlib
+
+MAGIC = b'T2TB'
+FORMAT_VERSION = 1
+
+# Teeko2 rules: four in a row or the corners of a 3x3 square with an empty center
+RULES_VARIANT = b'teeko2/3x3corner'
+
+_FIELDS = struct.Struct('<4sH4s16sQI')
+HEADER = struct.Struct('<4sH4s16sQII')
+
+
+class TableError(ValueError):
+    """ Raised when a table file is not a valid table of the expected kind. """
+
+
+def write_table(path, kind, payload):
+    """ Writes a table file.
+
+    The file is written next to its destination and renamed into place, so that
+    processes mapping the old file keep a consistent view.
+
+    Args:
+        path (str): file to write
+        kind (bytes): 4-byte tag of the payload type
+        payload (bytes-like): the table data
+    """
+    fields = _FIELDS.pack(MAGIC, FORMAT_VERSION, kind, RULES_VARIANT, len(payload),
+                          zlib.crc32(payload))
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(fields)
+        f.write(struct.pack('<I', zlib.crc32(fields)))
+        f.write(payload)
+    os.replace(tmp, path)
+
+
+class MappedTable:
+    """ A read-only memory mapping of a table file.
+
+    Attributes:
+        payload (memoryview): the table data, indexing it reads from the mapping
+    """
+
+    def __init__(self, path, kind):
+        """ Maps a table file and validates its header.
+
+        Args:
+            path (str): the table file
+            kind (bytes): the expected 4-byte payload tag
+
+        Raises:
+            TableError: if the header does not describe a table of this kind for
+                these rules, or the file size does not match it
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size:
+                raise TableError('%s is too small to be a table' % path)
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._check_header(kind, size)
+        except TableError:
+            self._map.close()
+            raise
+        if hasattr(self._map, 'madvise'):
+            # lookups jump around the file, read ahead would only waste page cache
+            self._map.madvise(mmap.MADV_RANDOM)
+        self.payload = memoryview(self._map)[HEADER.size:]
+
+    def _check_header(self, kind, size):
+        magic, version, file_kind, variant, length, payload_crc, header_crc = \
+            HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise TableError('%s is not a table file' % self.path)
+        if zlib.crc32(self._map[:_FIELDS.size]) != header_crc:
+            raise TableError('%s has a corrupt header' % self.path)
+        if version != FORMAT_VERSION:
+            raise TableError('%s has format version %d, expected %d' % (self.path, version, FORMAT_VERSION))
+        if file_kind != kind:
+            raise TableError('%s holds %r, expected %r' % (self.path, file_kind, kind))
+        if variant.rstrip(b'\0') != RULES_VARIANT:
+            raise TableError('%s is for rules %r' % (self.path, variant.rstrip(b'\0')))
+        if size != HEADER.size + length:
+            raise TableError('%s is %d bytes, expected %d' % (self.path, size, HEADER.size + length))
+        self.payload_crc = payload_crc
+
+    def verify(self):
+        """ Checks the payload against its checksum. This reads the whole file.
+
+        Returns:
+            bool: True if the payload is intact
+        """
+        crc = 0
+        step = 1 << 24
+        for start in range(0, len(self.payload), step):
+            crc = zlib.crc32(self.payload[start:start + step], crc)
+        return crc == self.payload_crc
+
+    def close(self):
+        """ Unmaps the file. Lookups fail afterwards. """
+        self.payload.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
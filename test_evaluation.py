@@ -0,0 +1,196 @@
+""" Checks of the fast evaluators and of the precomputed tables.
+
+Board.evaluate(), IncrementalBoard and the batched evaluator of batch_eval.py
+all replace Teeko2Player.heuristic_game_value() of the first version of
+game.py, and must give exactly its values. That version is kept below, on
+lists of lists, as the reference. The endgame table must index every
+movement-phase position once, and table files that don't fit the current
+format must be refused, leaving the player to search. Run with:
+
+    python -m pytest -q test_evaluation.py
+"""
+
+import random
+import struct
+import zlib
+
+import pytest
+
+import book
+import endgame
+import tables
+from bitboard import PIECES, SQUARES, Board, IncrementalBoard
+from game import Teeko2Player
+
+# windows of the original heuristic, as lists of (row, col); the last 9 are
+# the corners of the 3x3 squares, which only count while their center is empty
+LINES = ([[(i, j + k) for k in range(4)] for i in range(5) for j in range(2)] +
+         [[(i + k, j) for k in range(4)] for j in range(5) for i in range(2)] +
+         [[(i + k, j + k) for k in range(4)] for i in range(2) for j in range(2)] +
+         [[(i - k, j + k) for k in range(4)] for i in range(3, 5) for j in range(2)])
+SQUARE_CORNERS = [((i, j), [(i - 1, j - 1), (i + 1, j - 1), (i - 1, j + 1), (i + 1, j + 1)])
+                  for i in range(1, 4) for j in range(1, 4)]
+
+
+def reference_game_value(state, piece):
+    # Teeko2Player.game_value() of the first version
+    for win_loc in LINES:
+        first = state[win_loc[0][0]][win_loc[0][1]]
+        if first != ' ' and all(state[i][j] == first for i, j in win_loc):
+            return 1 if first == piece else -1
+    for (ci, cj), corners in SQUARE_CORNERS:
+        first = state[corners[0][0]][corners[0][1]]
+        if (state[ci][cj] == ' ' and first != ' ' and
+                all(state[i][j] == first for i, j in corners)):
+            return 1 if first == piece else -1
+    return 0
+
+
+def reference_heuristic(state, piece):
+    # Teeko2Player.heuristic_game_value() of the first version
+    value = reference_game_value(state, piece)
+    if value != 0:
+        return value
+    opp = PIECES[1 - PIECES.index(piece)]
+    windows = LINES + [corners for (ci, cj), corners in SQUARE_CORNERS if state[ci][cj] == ' ']
+    sum_player = 0
+    sum_opp = 0
+    for win_loc in windows:
+        cells = [state[i][j] for i, j in win_loc]
+        for who in (piece, opp):
+            n = cells.count(who)
+            if n in (2, 3) and cells.count(' ') == 4 - n:
+                if who == piece:
+                    sum_player += 1 if n == 2 else 3
+                else:
+                    sum_opp += 1 if n == 2 else 3
+    if sum_player + sum_opp == 0:
+        return 0.0
+    return (2.0 / (sum_player + sum_opp + 1)) * sum_player - 1
+
+
+def random_board(rng):
+    squares = rng.sample(range(SQUARES), rng.randint(0, 4) + rng.randint(0, 4))
+    n_black = rng.randint(0, min(4, len(squares)))
+    n_black = max(n_black, len(squares) - 4)
+    black = sum(1 << sq for sq in squares[:n_black])
+    red = sum(1 << sq for sq in squares[n_black:])
+    return Board(black, red)
+
+
+def test_evaluate_matches_reference():
+    rng = random.Random(1)
+    for i in range(5000):
+        board = random_board(rng)
+        state = board.to_state()
+        for player, piece in enumerate(PIECES):
+            assert board.evaluate(player) == reference_heuristic(state, piece), state
+
+
+def test_incremental_sums_follow_apply_and_undo():
+    rng = random.Random(2)
+    for game in range(200):
+        board = IncrementalBoard()
+        played = []
+        for ply in range(rng.randint(1, 40)):
+            player = len(played) % 2
+            if board.winner() is not None or rng.random() < 0.2 and played:
+                if not played:
+                    break
+                move, mover = played.pop()
+                board.undo(move, mover)
+            else:
+                moves = list(board.moves(player))
+                if not moves:
+                    break
+                move = rng.choice(moves)
+                board.apply(move, player)
+                played.append((move, player))
+            fresh = IncrementalBoard(*board.bits)
+            assert board.sums == fresh.sums
+            assert board.winner() == Board(*board.bits).winner()
+            state = board.to_state()
+            for p, piece in enumerate(PIECES):
+                assert board.evaluate(p) == reference_heuristic(state, piece)
+
+
+def test_batched_evaluation_matches_evaluate():
+    np = pytest.importorskip('numpy')
+    import batch_eval
+    rng = random.Random(3)
+    boards = [random_board(rng) for i in range(3000)]
+    black = np.array([b.bits[0] for b in boards], dtype=np.int64)
+    red = np.array([b.bits[1] for b in boards], dtype=np.int64)
+    for player in (0, 1):
+        values = batch_eval.evaluate_bits(black, red, player)
+        assert values.tolist() == [b.evaluate(player) for b in boards]
+
+
+def test_endgame_rank_round_trip():
+    rng = random.Random(4)
+    indices = [0, endgame.N_POSITIONS - 1] + [rng.randrange(endgame.N_POSITIONS) for i in range(5000)]
+    for index in indices:
+        side, mover, other = endgame.unrank(index)
+        assert bin(mover).count('1') == 4 and bin(other).count('1') == 4
+        assert not mover & other
+        assert endgame.rank(side, mover, other) == index
+
+
+def write_header(path, magic=tables.MAGIC, version=tables.FORMAT_VERSION, kind=book.KIND,
+                 variant=tables.RULES_VARIANT, payload=b'', length=None, header_crc=None):
+    # tables.write_table() with every header field open to tampering
+    fields = tables._FIELDS.pack(magic, version, kind, variant,
+                                 len(payload) if length is None else length, zlib.crc32(payload))
+    if header_crc is None:
+        header_crc = zlib.crc32(fields)
+    with open(path, 'wb') as f:
+        f.write(fields + struct.pack('<I', header_crc) + payload)
+
+
+@pytest.mark.parametrize('fields, message', [
+    ({'magic': b'XXXX'}, 'not a table file'),
+    ({'header_crc': 0}, 'corrupt header'),
+    ({'version': tables.FORMAT_VERSION + 1}, 'format version'),
+    ({'kind': endgame.KIND}, 'holds'),
+    ({'variant': b'teeko'}, 'is for rules'),
+    ({'length': 100}, 'bytes, expected'),
+])
+def test_table_header_is_checked(tmp_path, fields, message):
+    path = str(tmp_path / 'table.bin')
+    write_header(path, payload=book.RECORD.pack(1, 2), **fields)
+    with pytest.raises(tables.TableError, match=message):
+        tables.MappedTable(path, book.KIND)
+
+
+def test_table_too_small(tmp_path):
+    path = tmp_path / 'table.bin'
+    path.write_bytes(b'T2TB')
+    with pytest.raises(tables.TableError, match='too small'):
+        tables.MappedTable(str(path), book.KIND)
+
+
+def test_valid_table_maps(tmp_path):
+    path = str(tmp_path / 'book.bin')
+    payload = book.RECORD.pack(1, 2)
+    tables.write_table(path, book.KIND, payload)
+    with tables.MappedTable(path, book.KIND) as table:
+        assert bytes(table.payload) == payload
+        assert table.verify()
+
+
+def test_player_searches_without_unusable_tables(tmp_path):
+    # headers are valid, payload sizes are not
+    endgame_path = str(tmp_path / 'endgame.bin')
+    book_path = str(tmp_path / 'book.bin')
+    tables.write_table(endgame_path, endgame.KIND, bytes(10))
+    tables.write_table(book_path, book.KIND, bytes(book.RECORD.size + 1))
+    with pytest.raises(tables.TableError):
+        endgame.EndgameTable.open(endgame_path)
+    with pytest.raises(tables.TableError):
+        book.OpeningBook(book_path)
+    player = Teeko2Player(endgame_path=endgame_path, book_path=book_path, max_depth=1)
+    assert player.endgame is None and player.book is None
+    assert len(player.make_move(player.board)) == 1
+    # a directory can't even be opened
+    player = Teeko2Player(endgame_path=str(tmp_path), book_path=None)
+    assert player.endgame is None
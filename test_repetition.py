@@ -0,0 +1,122 @@
+""" Checks of the position history, the draw rule and repetitions in the search.
+
+Run with:
+
+    python -m pytest -q test_repetition.py
+"""
+
+import math
+
+import pytest
+
+import game
+from bitboard import Board, IncrementalBoard
+from game import Teeko2Player
+from repetition import DrawRule, PositionHistory
+
+# a movement-phase position without a winner, black to move
+BLACK = sum(1 << sq for sq in (0, 2, 10, 22))
+RED = sum(1 << sq for sq in (4, 14, 20, 24))
+
+
+class TallHistory(PositionHistory):
+    # remembers how high the stack grew and how high it was when truncated
+    def __init__(self, keys=()):
+        self.tallest = 0
+        self.truncated = None
+        super().__init__(keys)
+
+    def push(self, key):
+        super().push(key)
+        self.tallest = max(self.tallest, len(self.keys))
+
+    def truncate(self, length):
+        self.truncated = len(self.keys)
+        super().truncate(length)
+
+
+def searcher(depth):
+    player = Teeko2Player(piece='b', max_depth=depth, endgame_path=None, book_path=None,
+                          value_net=None)
+    player._me = 0
+    player._deadline = math.inf
+    player._depth_limit = depth
+    player.reserve_killers(depth)
+    return player
+
+
+def test_history_counts():
+    history = PositionHistory([1, 2, 1])
+    assert len(history) == 3 and history.count(1) == 2 and 2 in history
+    assert history.pop() == 1
+    assert history.count(1) == 1
+    history.push(3)
+    history.push(3)
+    history.truncate(1)
+    assert history.keys == [1] and history.counts == {1: 1}
+    assert 3 not in history and history.count(2) == 0
+    history.clear()
+    assert len(history) == 0 and not history.counts
+
+
+def test_draw_rule():
+    history = PositionHistory([1, 2, 1, 2])
+    assert DrawRule().check(history, 4) is None
+    history.push(1)
+    assert DrawRule().check(history, 5) == 'repetition'
+    assert DrawRule(repetitions=0).check(history, 5) is None
+    # only the position just reached counts
+    history.push(2)
+    history.push(4)
+    assert DrawRule().check(history, 7) is None
+    assert DrawRule(max_plies=7).check(history, 7) == 'max_plies'
+    assert DrawRule(max_plies=8).check(history, 7) is None
+    # a repetition is reported before the ply limit
+    assert DrawRule(2, 5).check(PositionHistory([1, 1]), 5) == 'repetition'
+
+
+def test_search_scores_repetitions_as_draws():
+    board = Board(BLACK, RED)
+    children = []
+    for move in board.moves(0):
+        board.apply(move, 0)
+        children.append(board.key(1))
+        board.undo(move, 0)
+    for batch_leaves in (False, True):
+        player = searcher(3)
+        if batch_leaves:
+            pytest.importorskip('numpy')
+            import batch_eval
+            player.batch_eval = batch_eval
+        player.positions = PositionHistory([board.key(0)] + children)
+        search_board = IncrementalBoard(BLACK, RED)
+        for move in list(search_board.moves(0)):
+            search_board.apply(move, 0)
+            assert player.max_value(search_board, 1, 1) == 0
+            search_board.undo(move, 0)
+        assert len(player.positions) == 1 + len(children)
+
+
+def test_search_pops_its_line():
+    player = searcher(3)
+    player.positions = TallHistory([Board(BLACK, RED).key(0)])
+    board = IncrementalBoard(BLACK, RED)
+    move = next(iter(board.moves(0)))
+    board.apply(move, 0)
+    player.max_value(board, 1, 1)
+    assert player.positions.tallest > 1
+    assert len(player.positions) == 1
+
+
+def test_timeout_truncates_the_line(monkeypatch):
+    # a clock that stands still for 300 nodes, then runs out; read at every node
+    player = Teeko2Player(piece='b', endgame_path=None, book_path=None, value_net=None)
+    monkeypatch.setattr(game.time, 'perf_counter', lambda: 0 if player.nodes < 300 else 10)
+    monkeypatch.setattr(game, 'NODE_CHECK_INTERVAL', 1)
+    start = Board(BLACK, RED).key(0)
+    player.positions = TallHistory([start])
+    player.iterative_deepening(Board(BLACK, RED), 0, 1)
+    # the clock ran out below the root, with the line on the stack
+    assert player.depth_reached >= 1
+    assert player.positions.truncated > 1
+    assert player.positions.keys == [start] and player.positions.counts == {start: 1}
@@ -0,0 +1,252 @@
+""" Offline trainer of the value network of value_net.py.
+
+Training positions come from self-play and, if a solved endgame table is
+available, from the table. In the self-play games both sides search to a fixed
+depth, with some random moves for variety, and every position is labeled with
+the outcome of its game for the player who just moved (1 win, -1 loss, 0 for a
+game stopped after --max-plies), discounted by DISCOUNT per ply to the end.
+Endgame positions are labeled with their solved value the same way. Every
+position is used under all 8 symmetries of the board.
+
+The network is trained on the CPU with Adam on the squared error:
+
+    python train_value.py --games 2000 --workers 8 --out teeko2_value.npz
+    python train_value.py --games 2000 --net teeko2_value.npz --out teeko2_value.npz
+
+The second command plays the self-play games with the network of the first.
+"""
+
+import argparse
+import math
+import multiprocessing
+import random
+import sys
+
+import numpy as np
+
+from bitboard import PIECES, SQUARES, Board
+from symmetry import transform
+from value_net import DEFAULT_HIDDEN, VALUE_NET_FILE, ValueNet, features
+
+# the label of a position n plies before the end of its game is outcome * DISCOUNT**n
+DISCOUNT = 0.97
+
+# transposition table size of the self-play players
+SELFPLAY_TT_BYTES = 4 * 1024 * 1024
+
+
+def play_game(seed, depth=2, epsilon=0.1, max_plies=80, net=None):
+    """ Plays one self-play game.
+
+    Args:
+        seed (int): seed of the random moves
+        depth (int): search depth of both sides
+        epsilon (float): probability of a random move instead of the searched one
+        max_plies (int): plies after which the game is stopped as a draw
+        net (str): value network weights file the players search with, if any
+
+    Returns:
+        list: (own, other, target) for every position of the game but the last,
+            own and other the bitboards of the player who just moved and of the
+            player to move
+    """
+    # imported here, game.py imports value_net.py
+    from game import Teeko2Player
+    rng = random.Random(seed)
+    players = [Teeko2Player(piece=piece, max_depth=depth, tt_bytes=SELFPLAY_TT_BYTES, value_net=net,
+                            endgame_path=None, book_path=None) for piece in PIECES]
+    board = Board()
+    positions = []
+    winner = None
+    for ply in range(max_plies):
+        player = ply % 2
+        moves = list(board.moves(player))
+        if not moves:
+            winner = 1 - player
+            break
+        if rng.random() < epsilon:
+            move = rng.choice(moves)
+        else:
+            move = players[player].iterative_deepening(board, player, math.inf)
+        board.apply(move, player)
+        winner = board.winner()
+        if winner is not None:
+            break
+        positions.append((board.bits[player], board.bits[1 - player], player))
+
+    samples = []
+    for i, (own, other, mover) in enumerate(positions):
+        if winner is None:
+            target = 0.0
+        else:
+            target = (1.0 if winner == mover else -1.0) * DISCOUNT ** (len(positions) - i)
+        samples.append((own, other, target))
+    return samples
+
+
+def _play(args):
+    return play_game(*args)
+
+
+def selfplay_positions(games, depth=2, epsilon=0.1, max_plies=80, net=None, workers=None, seed=0,
+                       log=None):
+    """ Plays self-play games on a process pool and returns all their positions. """
+    log = log or (lambda message: None)
+    tasks = [(seed * 1000003 + i, depth, epsilon, max_plies, net) for i in range(games)]
+    samples = []
+    with multiprocessing.Pool(workers) as pool:
+        for done, game in enumerate(pool.imap_unordered(_play, tasks), 1):
+            samples.extend(game)
+            if done % 100 == 0 or done == games:
+                log('%d/%d games, %d positions' % (done, games, len(samples)))
+    return samples
+
+
+def endgame_positions(path, count, seed=0):
+    """ Samples positions with all eight pieces down and labels them from a solved table.
+
+    Args:
+        path (str): endgame table file (see endgame.py)
+        count (int): number of positions
+        seed (int): seed of the sampling
+
+    Returns:
+        list: (own, other, target) like play_game()
+    """
+    from endgame import DRAW, EndgameTable
+    table = EndgameTable.open(path)
+    rng = random.Random(seed)
+    samples = []
+    while len(samples) < count:
+        squares = rng.sample(range(SQUARES), 8)
+        own = sum(1 << sq for sq in squares[:4])
+        other = sum(1 << sq for sq in squares[4:])
+        board = Board(own, other)
+        if board.winner() is not None:
+            continue
+        # own just moved, so other (player 1 on this board) is to move
+        result, distance = table.probe(board, 1)
+        target = 0.0 if result == DRAW else -result * DISCOUNT ** distance
+        samples.append((own, other, target))
+    return samples
+
+
+def augment(samples):
+    """ Returns the (own, other, target) arrays of the samples under all 8 symmetries. """
+    own = []
+    other = []
+    targets = []
+    for a, b, target in samples:
+        for t in range(8):
+            own.append(transform(a, t))
+            other.append(transform(b, t))
+            targets.append(target)
+    return np.array(own, dtype=np.int64), np.array(other, dtype=np.int64), np.array(targets, dtype=np.float32)
+
+
+def train(own, other, targets, hidden=DEFAULT_HIDDEN, epochs=30, batch_size=256, lr=1e-3,
+          validation=0.1, seed=0, log=None):
+    """ Fits a value network to labeled positions with Adam.
+
+    Args:
+        own (np.ndarray): bitboards of the player who just moved
+        other (np.ndarray): bitboards of the player to move
+        targets (np.ndarray): labels in [-1, 1]
+        hidden (tuple): sizes of the hidden layers
+        epochs (int): passes over the training positions
+        batch_size (int): positions per gradient step
+        lr (float): Adam step size
+        validation (float): fraction of the positions held out to report the error on
+        seed (int): seed of the initialization and the shuffling
+        log (callable): optional function called with progress messages
+
+    Returns:
+        ValueNet: the trained network
+    """
+    log = log or (lambda message: None)
+    rng = np.random.default_rng(seed)
+    x = features(own, other)
+    y = np.asarray(targets, dtype=np.float32)
+    order = rng.permutation(len(y))
+    n_val = int(len(y) * validation)
+    val, fit = order[:n_val], order[n_val:]
+
+    net = ValueNet.random(hidden, seed)
+    params = [p for layer in net.layers for p in layer]
+    m = [np.zeros_like(p) for p in params]
+    v = [np.zeros_like(p) for p in params]
+    beta1, beta2, eps = 0.9, 0.999, 1e-8
+    step = 0
+    for epoch in range(1, epochs + 1):
+        rng.shuffle(fit)
+        for start in range(0, len(fit), batch_size):
+            batch = fit[start:start + batch_size]
+            grads = _gradients(net, x[batch], y[batch])
+            step += 1
+            for i, (p, g) in enumerate(zip(params, grads)):
+                m[i] = beta1 * m[i] + (1 - beta1) * g
+                v[i] = beta2 * v[i] + (1 - beta2) * g * g
+                m_hat = m[i] / (1 - beta1 ** step)
+                v_hat = v[i] / (1 - beta2 ** step)
+                p -= lr * m_hat / (np.sqrt(v_hat) + eps)
+        train_error = float(np.mean((net.forward(x[fit]) - y[fit]) ** 2))
+        val_error = float(np.mean((net.forward(x[val]) - y[val]) ** 2)) if n_val else float('nan')
+        log('epoch %d: train mse %.4f, validation mse %.4f' % (epoch, train_error, val_error))
+    return net
+
+
+def _gradients(net, x, y):
+    # gradients of the mean squared error, in the order of the parameters of net.layers
+    activations = [x]
+    for w, b in net.layers[:-1]:
+        activations.append(np.maximum(activations[-1] @ w + b, 0.0))
+    w, b = net.layers[-1]
+    out = np.tanh(activations[-1] @ w + b)[:, 0]
+    delta = (2.0 / len(y) * (out - y) * (1.0 - out * out))[:, None]
+    grads = []
+    for i in range(len(net.layers) - 1, -1, -1):
+        w, b = net.layers[i]
+        a = activations[i]
+        grads.append(delta.sum(axis=0))
+        grads.append(a.T @ delta)
+        if i:
+            delta = (delta @ w.T) * (a > 0)
+    grads.reverse()
+    return grads
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train the Teeko2 value network.')
+    parser.add_argument('--games', type=int, default=1000, help='number of self-play games')
+    parser.add_argument('--depth', type=int, default=2, help='search depth of the self-play players')
+    parser.add_argument('--epsilon', type=float, default=0.1, help='probability of a random self-play move')
+    parser.add_argument('--max-plies', type=int, default=80, help='plies after which a game is a draw')
+    parser.add_argument('--net', default=None, help='value network the self-play players search with')
+    parser.add_argument('--endgame', default=None, help='solved endgame table to sample positions from')
+    parser.add_argument('--endgame-positions', type=int, default=50000,
+                        help='number of positions sampled from the endgame table')
+    parser.add_argument('--hidden', type=int, nargs='+', default=list(DEFAULT_HIDDEN),
+                        help='sizes of the hidden layers')
+    parser.add_argument('--epochs', type=int, default=30, help='passes over the training positions')
+    parser.add_argument('--batch-size', type=int, default=256, help='positions per gradient step')
+    parser.add_argument('--lr', type=float, default=1e-3, help='Adam step size')
+    parser.add_argument('--workers', type=int, default=None, help='number of self-play processes')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--out', default=VALUE_NET_FILE, help='weights file to write')
+    args = parser.parse_args(argv)
+
+    log = lambda message: print(message, file=sys.stderr)
+    samples = selfplay_positions(args.games, args.depth, args.epsilon, args.max_plies, args.net,
+                                 args.workers, args.seed, log=log) if args.games else []
+    if args.endgame:
+        samples += endgame_positions(args.endgame, args.endgame_positions, args.seed)
+    own, other, targets = augment(samples)
+    log('%d training positions with symmetries' % len(targets))
+    net = train(own, other, targets, tuple(args.hidden), args.epochs, args.batch_size, args.lr,
+                seed=args.seed, log=log)
+    net.save(args.out)
+    print('wrote %s' % args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+""" A bounded transposition table for the Teeko2Player search.
+
+Positions are keyed by the Zobrist hash of the board and the side to move
+(Board.key()). The table is an array of buckets with two slots each: a
+depth-preferred slot that keeps the most expensive result, and an
+always-replace slot that keeps the most recent one.
+"""
+
+# bound types of a stored value
+EXACT = 0
+LOWER = 1   # the value is a lower bound (the search failed high)
+UPPER = 2   # the value is an upper bound (the search failed low)
+
+# approximate memory used by one entry: the list slot, the entry tuple and its
+# hash and value objects
+ENTRY_BYTES = 160
+
+DEFAULT_TT_BYTES = 64 * 1024 * 1024
+
+
+class TranspositionTable:
+    """ Stores search results by position, with a fixed memory budget.
+
+    Entries are tuples (key, depth, value, bound, move, generation) where depth
+    is the number of plies searched below the position. The table keeps its
+    contents across searches; call new_search() before every move so that
+    results of earlier moves give way to fresh ones in the depth-preferred slots.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_TT_BYTES):
+        """ Initializes an empty table.
+
+        Args:
+            max_bytes (int): approximate memory cap of the table in bytes
+        """
+        self.buckets = max(1, max_bytes // (2 * ENTRY_BYTES))
+        self.generation = 0
+        self._deep = [None] * self.buckets
+        self._recent = [None] * self.buckets
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.replacements = 0
+
+    def new_search(self):
+        """ Marks the start of a new move, aging the entries of earlier ones. """
+        self.generation += 1
+
+    def probe(self, key):
+        """ Looks up a position.
+
+        Args:
+            key (int): Board.key() of the position
+
+        Returns:
+            tuple: the stored (key, depth, value, bound, move, generation) entry,
+                or None
+        """
+        self.probes += 1
+        i = key % self.buckets
+        entry = self._deep[i]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        entry = self._recent[i]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, key, depth, value, bound, move):
+        """ Records the result of a search.
+
+        The depth-preferred slot takes the entry if it is empty, holds the same
+        position, holds a shallower result or one from an earlier move; its old
+        entry then moves down to the always-replace slot. Otherwise the entry goes
+        to the always-replace slot.
+
+        Args:
+            key (int): Board.key() of the position
+            depth (int): plies searched below the position
+            value (float): the search value
+            bound (int): EXACT, LOWER or UPPER
+            move (Move): the best move found, or None
+        """
+        self.stores += 1
+        i = key % self.buckets
+        entry = (key, depth, value, bound, move, self.generation)
+        deep = self._deep[i]
+        if deep is None or deep[0] == key or depth >= deep[1] or deep[5] != self.generation:
+            if deep is not None and deep[0] != key:
+                self.replacements += 1
+                self._recent[i] = deep
+            self._deep[i] = entry
+        else:
+            if self._recent[i] is not None and self._recent[i][0] != key:
+                self.replacements += 1
+            self._recent[i] = entry
+
+    def clear(self):
+        """ Empties the table and resets the counters. """
+        self._deep = [None] * self.buckets
+        self._recent = [None] * self.buckets
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.replacements = 0
+
+    def __len__(self):
+        return (sum(1 for entry in self._deep if entry is not None)
+                + sum(1 for entry in self._recent if entry is not None))
+
+    @property
+    def capacity(self):
+        """ The maximum number of entries. """
+        return 2 * self.buckets
+
+    @property
+    def hit_rate(self):
+        """ The fraction of probes that found their position. """
+        return self.hits / self.probes if self.probes else 0.0
+
+    def stats(self):
+        """ Returns the usage counters of the table as a dict. """
+        return {
+            'probes': self.probes,
+            'hits': self.hits,
+            'hit_rate': self.hit_rate,
+            'stores': self.stores,
+            'replacements': self.replacements,
+            'entries': len(self),
+            'capacity': self.capacity,
+        }
@@ -0,0 +1,117 @@
+""" Neural network value function for the leaves of the Teeko2Player search.
+
+A small multilayer perceptron scores a position for the player who just moved
+(the other player is to move). Its 50 inputs are the squares of that player's
+pieces followed by the squares of the opponent's, in row-major order; hidden
+layers use ReLU and the output tanh, so values lie in (-1, 1) like the
+heuristic's. Won and lost positions still score exactly 1 and -1.
+
+Inference is plain NumPy and batched: the search scores all the children of a
+node just above the horizon in one call, like the batched heuristic of
+batch_eval.py, whose evaluate_bits() interface this module shares. Weights are
+trained offline by train_value.py and stored in a compressed .npz file, which
+Teeko2Player loads from VALUE_NET_FILE by default when it exists:
+
+    python train_value.py --games 2000 --out teeko2_value.npz
+    Teeko2Player()
+    Teeko2Player(value_net=None)    # the heuristic
+"""
+
+import os
+
+import numpy as np
+
+import batch_eval
+from bitboard import SQUARES
+
+VALUE_NET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'teeko2_value.npz')
+
+INPUTS = 2 * SQUARES
+
+DEFAULT_HIDDEN = (64, 32)
+
+_SHIFTS = np.arange(SQUARES, dtype=np.int64)
+
+
+def features(own, other):
+    """ Builds the network inputs of positions given as bitboards.
+
+    Args:
+        own (array-like): N bitboards of the pieces of the player who just moved
+        other (array-like): N bitboards of the pieces of the player to move
+
+    Returns:
+        np.ndarray: (N, 50) float32 inputs
+    """
+    own = np.asarray(own, dtype=np.int64).reshape(-1, 1)
+    other = np.asarray(other, dtype=np.int64).reshape(-1, 1)
+    return np.concatenate([(own >> _SHIFTS) & 1, (other >> _SHIFTS) & 1], axis=1).astype(np.float32)
+
+
+class ValueNet:
+    """ A multilayer perceptron given by its list of (weights, bias) layers. """
+
+    # the search reaches numpy through its batch evaluator
+    np = np
+
+    def __init__(self, layers):
+        """ Wraps layers of float32 arrays, weights of shape (inputs, outputs). """
+        self.layers = [(np.asarray(w, dtype=np.float32), np.asarray(b, dtype=np.float32))
+                       for w, b in layers]
+        if self.layers[0][0].shape[0] != INPUTS or self.layers[-1][0].shape[1] != 1:
+            raise ValueError('a value network maps %d inputs to 1 output' % INPUTS)
+
+    @classmethod
+    def random(cls, hidden=DEFAULT_HIDDEN, seed=None):
+        """ Returns an untrained network with He-initialized weights. """
+        rng = np.random.default_rng(seed)
+        sizes = (INPUTS,) + tuple(hidden) + (1,)
+        return cls([(rng.normal(0.0, np.sqrt(2.0 / n), (n, m)), np.zeros(m))
+                    for n, m in zip(sizes, sizes[1:])])
+
+    @classmethod
+    def load(cls, path):
+        """ Loads a network written by save(). """
+        with np.load(path) as data:
+            n = len(data.files) // 2
+            return cls([(data['w%d' % i], data['b%d' % i]) for i in range(n)])
+
+    def save(self, path):
+        """ Writes the weights to a compressed .npz file. """
+        arrays = {}
+        for i, (w, b) in enumerate(self.layers):
+            arrays['w%d' % i] = w
+            arrays['b%d' % i] = b
+        # write the whole file before it replaces an older one, like tables.write_table()
+        tmp = path + '.tmp.npz'
+        np.savez_compressed(tmp, **arrays)
+        os.replace(tmp, path)
+
+    def forward(self, x):
+        """ Returns the (N,) outputs of the network for (N, 50) inputs. """
+        for w, b in self.layers[:-1]:
+            x = np.maximum(x @ w + b, 0.0)
+        w, b = self.layers[-1]
+        return np.tanh(x @ w + b)[:, 0]
+
+    def evaluate_bits(self, black, red, player, mover):
+        """ Scores positions reached by a move of mover, from player's point of view.
+
+        Args:
+            black (array-like): N bitboards of the black pieces
+            red (array-like): N bitboards of the red pieces
+            player (int): the point of view, 0 for black and 1 for red
+            mover (int): the player who just moved
+
+        Returns:
+            np.ndarray: N float64 values, exactly 1 or -1 for won or lost positions
+        """
+        black = np.asarray(black, dtype=np.int64)
+        red = np.asarray(red, dtype=np.int64)
+        own, other = (black, red) if mover == 0 else (red, black)
+        values = self.forward(features(own, other)).astype(np.float64)
+        if mover != player:
+            values = -values
+        counts = batch_eval.window_counts(batch_eval.encode(black, red))
+        won, result = batch_eval.terminal_values(*counts, player)
+        return np.where(won, result, values)